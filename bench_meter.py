@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Meter message throughput, python-osc dispatcher vs. the meter fast path in
+osc_state._OSCProtocolFactory.
+
+    ./bench_meter.py              # in process, datagrams fed to the protocol
+    ./bench_meter.py --udp        # through a local socket, in bursts
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import socket
+import time
+
+from pythonosc.osc_message_builder import OscMessageBuilder
+
+import osc_state
+
+
+def build_meter_datagrams(count, strips=8):
+    res = []
+    for i in range(count):
+        ssid = i % (strips + 1)
+        # mostly changing values, like METER_DB feedback of a running session
+        value = random.uniform(-60., 0.)
+        if ssid == strips:
+            b = OscMessageBuilder('/master/meter')
+        else:
+            b = OscMessageBuilder('/strip/meter')
+            b.add_arg(ssid + 1)
+        b.add_arg(value)
+        res.append(b.build().dgram)
+    return res
+
+
+def make_state(strips=8):
+    # meter_rate=0: every changed value notifies, to count deliveries in --udp mode
+    ors = osc_state.OscRemoteState(meter_rate=0)
+    for ssid in range(1, strips+1):
+        ors.strips[ssid] = osc_state.StripState(ors, ssid)
+    ors.strips['master'] = osc_state.StripState(ors, 'master')
+    return ors
+
+
+async def bench_inprocess(datagrams, fast):
+    ors = make_state()
+    protocol = osc_state._OSCProtocolFactory(ors._get_dispatcher())
+    if fast:
+        protocol.meter_sink = ors.on_meter
+    address = ('127.0.0.1', 3819)
+
+    start = time.perf_counter()
+    for data in datagrams:
+        protocol.datagram_received(data, address)
+    elapsed = time.perf_counter() - start
+    # let the coalesced notification run, not part of the measurement
+    await asyncio.sleep(ors.notify_delay * 2)
+    return elapsed
+
+
+async def bench_udp(datagrams, fast, burst):
+    ors = make_state()
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+            lambda: osc_state._OSCProtocolFactory(ors._get_dispatcher()), local_addr=('127.0.0.1', 0))
+    if fast:
+        protocol.meter_sink = ors.on_meter
+
+    # count everything that reaches the store, either path
+    received = 0
+    last = None
+    done = asyncio.Event()
+    total = len(datagrams)
+    on_strip_changed = ors.on_strip_changed
+    def count(strip):
+        nonlocal received, last
+        received += 1
+        last = time.perf_counter()
+        if received >= total:
+            done.set()
+        on_strip_changed(strip)
+    ors.on_strip_changed = count
+
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    target = transport.get_extra_info('sockname')
+
+    start = time.perf_counter()
+    for i in range(0, total, burst):
+        for data in datagrams[i:i+burst]:
+            sender.sendto(data, target)
+        # give the receiver a chance, the kernel buffer is limited
+        await asyncio.sleep(0)
+    try:
+        await asyncio.wait_for(done.wait(), 2.)
+    except asyncio.TimeoutError:
+        pass
+    # up to the last delivered message, not the timeout
+    elapsed = (last or time.perf_counter()) - start
+
+    sender.close()
+    transport.close()
+    return elapsed, received
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Meter message throughput benchmark')
+    parser.add_argument('-n', '--count', type=int, default=200000, help='number of meter messages')
+    parser.add_argument('--udp', action='store_true', help='send through a local UDP socket')
+    parser.add_argument('--burst', type=int, default=64, help='datagrams per burst in --udp mode')
+    args = parser.parse_args()
+
+    # measure the message path, not the debug logging of every change
+    osc_state.LOG_STATE_CHANGES = False
+    logging.basicConfig(level=logging.WARNING)
+
+    datagrams = build_meter_datagrams(args.count)
+
+    for name, fast in (('dispatcher', False), ('fast path', True)):
+        if args.udp:
+            elapsed, received = asyncio.run(bench_udp(datagrams, fast, args.burst))
+            lost = args.count - received
+            print(f'{name:>10}: {received/elapsed:10.0f} msgs/s ({received} received, {lost} lost)')
+        else:
+            elapsed = asyncio.run(bench_inprocess(datagrams, fast))
+            print(f'{name:>10}: {args.count/elapsed:10.0f} msgs/s ({elapsed*1e6/args.count:.2f} us/msg)')
+
+
+if __name__ == '__main__':
+    main()
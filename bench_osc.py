@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+OSC throughput and latency benchmark. A sender process sends synthetic
+Ardour feedback, one scenario per address, to an OscRemoteState socket, at
+a fixed rate or as fast as possible. For each scenario it reports:
+
+- processed messages per second, and how many got lost
+- callback latency, from a datagram's arrival to the change notification
+- notifications (redraw requests) per second, and with --draw the frames
+  per second a real StripView renders for them
+- CPU time per message in the receiving process
+
+    ./bench_osc.py                          # all scenarios, flat out
+    ./bench_osc.py --rate 20000 --draw      # paced, rendering the StripView (needs pycairo)
+    ./bench_osc.py --output new.json --compare old.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import random
+import socket
+import statistics
+import time
+
+from pythonosc.osc_message_builder import OscMessageBuilder
+
+import osc_state
+import render
+import util
+
+
+STRIPS = 8
+
+def _build(address, *args):
+    b = OscMessageBuilder(address)
+    for arg in args:
+        b.add_arg(arg)
+    return b.build().dgram
+
+# scenario name -> message generator (index -> datagram), values change with
+# every message so none are dropped as repeated
+SCENARIOS = {
+        '/strip/meter': lambda i: _build('/strip/meter', i % STRIPS + 1, random.uniform(-60., 0.)),
+        '/master/meter': lambda i: _build('/master/meter', random.uniform(-60., 0.)),
+        '/strip/fader': lambda i: _build('/strip/fader', i % STRIPS + 1, random.random()),
+        '/strip/gain': lambda i: _build('/strip/gain', i % STRIPS + 1, random.uniform(-60., 6.)),
+        '/strip/mute': lambda i: _build('/strip/mute', i % STRIPS + 1, (i // STRIPS) % 2),
+        '/strip/name': lambda i: _build('/strip/name', i % STRIPS + 1, f'Audio {i}'),
+        '/session_name': lambda i: _build('/session_name', f'session {i}'),
+    }
+
+
+def _sender_main(address, scenario, count, rate, burst, ready):
+    random.seed(0)
+    datagrams = [ SCENARIOS[scenario](i) for i in range(count) ]
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    ready.wait()
+    start = time.perf_counter()
+    for i in range(0, count, burst):
+        for data in datagrams[i:i+burst]:
+            sock.sendto(data, address)
+        if rate:
+            delay = start + (i + burst) / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    sock.close()
+
+
+class BenchLogic():
+    """
+    Stand-in for main.Logic and ArdourOscLogic around a real StripView:
+    same redraw trigger and render executor, but no device to upload to.
+    Counts the rendered frames.
+    """
+
+    def __init__(self, ors, render_threads=2):
+        import main # local, main() below shadows the module
+        import views
+        self.ors = ors
+        self.logic = self
+        self.render_process = None
+        self.render_executor = render.RenderExecutor(render_threads)
+        self._render_task = None
+        self._redraw_pending = False
+        self.frames = 0
+        # as in main.Logic
+        self.redraw_trigger = util.AsyncTrigger(.01, .02, lambda: self.draw())
+        self.config_trigger = util.AsyncTrigger(.01, .02, lambda: None)
+        self.fader_targets = main.FaderTargets(self)
+        self.strip_view = views.StripView(self)
+        self.view_list = [self.strip_view]
+
+    def set_page(self, page_index):
+        self.ors.set_bank(page_index * STRIPS + 1)
+
+    def draw(self):
+        for view in self.view_list[::-1]:
+            if view.draw(self):
+                return
+
+    def render_screens(self, left, right):
+        if self._render_task is not None:
+            self._redraw_pending = True
+            return True
+        self._render_task = asyncio.create_task(self._render(left, right))
+        return True
+
+    async def _render(self, left, right):
+        try:
+            await self.render_executor.render([left, right])
+            self.frames += 1
+        finally:
+            self._render_task = None
+            if self._redraw_pending:
+                self._redraw_pending = False
+                self.redraw_trigger.trigger()
+
+
+class BenchReceiver():
+    def __init__(self, draw=False):
+        self.ors = osc_state.OscRemoteState()
+        for ssid in range(1, STRIPS+1):
+            self.ors.strips[ssid] = osc_state.StripState(self.ors, ssid)
+        self.ors.strips['master'] = osc_state.StripState(self.ors, 'master')
+        self.ors.register_changed_callback(self.on_changed)
+
+        self.received = 0
+        self.first = None
+        self.last = None
+        self.pending = [] # arrival times of datagrams not notified yet
+        self.latencies = []
+        self.notifications = 0
+
+        self.logic = BenchLogic(self.ors) if draw else None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.transport, self.protocol = await loop.create_datagram_endpoint(
+                lambda: osc_state._OSCProtocolFactory(self.ors._get_dispatcher()), local_addr=('127.0.0.1', 0))
+        self.ors.transport = self.transport
+        self.ors._set_recv_buffer()
+        self.protocol.meter_sink = self.ors.on_meter
+        if self.ors.meters is not None:
+            self.ors.meters.start()
+
+        # count and timestamp every datagram, on both paths
+        handle_datagram = self.protocol._handle_datagram
+        def counting_handle_datagram(data, client_address):
+            now = time.perf_counter()
+            if self.first is None:
+                self.first = now
+            self.last = now
+            self.received += 1
+            self.pending.append(now)
+            handle_datagram(data, client_address)
+        self.protocol._handle_datagram = counting_handle_datagram
+
+        if self.logic is not None:
+            # the strips as if listed by Ardour, to build the view's drawers
+            changes = osc_state.StripListChanges()
+            changes.added.update(ssid for ssid in self.ors.strips if isinstance(ssid, int))
+            self.logic.strip_view.on_osc_event(self.logic, osc_state.OscEventType.STRIP_LIST, changes)
+        return self.transport.get_extra_info('sockname')
+
+    def stop(self):
+        if self.ors.meters is not None:
+            self.ors.meters.stop()
+        if self.logic is not None:
+            self.logic.render_executor.shutdown()
+        self.transport.close()
+
+    def on_changed(self, event_type, *args):
+        now = time.perf_counter()
+        self.notifications += 1
+        self.latencies.extend(now - t for t in self.pending)
+        self.pending.clear()
+        if self.logic is not None:
+            self.logic.strip_view.on_osc_event(self.logic, event_type, *args)
+
+
+async def run_scenario(scenario, count, rate, burst, draw, timeout=5.):
+    receiver = BenchReceiver(draw)
+    address = await receiver.start()
+
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Event()
+    sender = ctx.Process(target=_sender_main, args=(address, scenario, count, rate, burst, ready), daemon=True)
+    sender.start()
+
+    loop = asyncio.get_running_loop()
+    cpu_start = time.process_time()
+    ready.set()
+    # wait for the sender to finish, then for the receiver to go idle
+    while sender.is_alive():
+        await asyncio.sleep(.05)
+    idle_since = loop.time()
+    received = receiver.received
+    while loop.time() - idle_since < .2 and receiver.received < count:
+        await asyncio.sleep(.02)
+        if receiver.received != received:
+            received = receiver.received
+            idle_since = loop.time()
+    await asyncio.sleep(.1) # last notifications and meter publish
+    cpu = time.process_time() - cpu_start
+    receiver.stop()
+
+    elapsed = (receiver.last - receiver.first) if receiver.received > 1 else 0.
+    latencies = sorted(receiver.latencies)
+    res = {
+            'sent': count,
+            'received': receiver.received,
+            'lost': count - receiver.received,
+            'msgs_per_s': receiver.received / elapsed if elapsed else 0.,
+            'cpu_us_per_msg': cpu * 1e6 / receiver.received if receiver.received else 0.,
+            'latency_ms_mean': statistics.fmean(latencies) * 1e3 if latencies else 0.,
+            'latency_ms_p99': latencies[int(len(latencies) * .99)] * 1e3 if latencies else 0.,
+            'notifications_per_s': receiver.notifications / elapsed if elapsed else 0.,
+        }
+    if draw:
+        res['frames_per_s'] = receiver.logic.frames / elapsed if elapsed else 0.
+    return res
+
+
+def print_results(results, previous=None):
+    columns = ('msgs_per_s', 'lost', 'cpu_us_per_msg', 'latency_ms_mean', 'latency_ms_p99', 'notifications_per_s', 'frames_per_s')
+    columns = [ c for c in columns if any(c in r for r in results.values()) ]
+    print(f'{"address":<16}' + ''.join(f'{c:>22}' for c in columns))
+    for scenario, res in results.items():
+        line = f'{scenario:<16}'
+        for c in columns:
+            value = res.get(c)
+            if value is None:
+                line += f'{"-":>22}'
+                continue
+            cell = f'{value:.1f}'
+            old = (previous or {}).get(scenario, {}).get(c)
+            if old:
+                cell += f' ({(value - old) / old * 100:+.0f}%)'
+            line += f'{cell:>22}'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OSC throughput and latency benchmark')
+    parser.add_argument('-n', '--count', type=int, default=50000, help='messages per scenario')
+    parser.add_argument('--rate', type=float, default=0, help='messages per second to send, 0 for as fast as possible')
+    parser.add_argument('--burst', type=int, default=32, help='datagrams sent back to back')
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help='run only these (repeatable)')
+    parser.add_argument('--draw', action='store_true', help='render a StripView for the changes (needs pycairo)')
+    parser.add_argument('--output', help='save the results as json')
+    parser.add_argument('--compare', help='json results of an earlier run to compare with')
+    args = parser.parse_args()
+
+    # measure the message path, not the debug logging of every change
+    osc_state.LOG_STATE_CHANGES = False
+    logging.basicConfig(level=logging.WARNING)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+
+    results = {}
+    for scenario in args.scenario or SCENARIOS:
+        results[scenario] = asyncio.run(run_scenario(scenario, args.count, args.rate, args.burst, args.draw))
+    print_results(results, previous)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                    'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'args': vars(args),
+                    'results': results,
+                }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
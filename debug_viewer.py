@@ -0,0 +1,67 @@
+#!/usr/bin/python
+
+# Display the frames of a running nikontrol (started with --publish-frames)
+# from a separate process, at the viewer's own refresh rate.
+
+import argparse
+import logging
+
+import frame_shm
+import gui
+import gui_debug
+
+from gi.repository import GLib
+from gi.repository import Gtk
+
+class FrameViewer():
+
+    def __init__(self, name, fps):
+        self.name = name
+        self.fps = fps
+        self.frame_buffer = None
+        self.last_frame_numbers = [None] * frame_shm.SCREENS
+        self.window = gui_debug.DebugWindow(Gtk.main_quit)
+        self.window.set_title('nikontrol frame viewer')
+
+    def _attach(self):
+        try:
+            self.frame_buffer = frame_shm.SharedFrameBuffer(self.name)
+        except FileNotFoundError:
+            return False
+        logging.info(f'attached to {self.frame_buffer.path}')
+        return True
+
+    def tick(self):
+        if self.frame_buffer is not None and self.frame_buffer.is_stale():
+            # controller restarted, its new segment is another file
+            logging.info(f'{self.frame_buffer.path} was recreated, reattaching')
+            self.frame_buffer.close()
+            self.frame_buffer = None
+            self.last_frame_numbers = [None] * frame_shm.SCREENS
+        if self.frame_buffer is None and not self._attach():
+            return True
+
+        for screen in range(frame_shm.SCREENS):
+            if self.frame_buffer.get_frame_number(screen) == self.last_frame_numbers[screen]:
+                continue
+            try:
+                frame_number, data = self.frame_buffer.read(screen)
+            except BlockingIOError:
+                continue
+            self.last_frame_numbers[screen] = frame_number
+            self.window.upload_image(screen, 0, 0, gui.surface_from_rgb565(data, frame_shm.WIDTH, frame_shm.HEIGHT))
+
+        return True
+
+    def run(self):
+        GLib.timeout_add(1000 // self.fps, self.tick)
+        Gtk.main()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--name', default=frame_shm.DEFAULT_NAME, help='shared memory segment name')
+    parser.add_argument('--fps', type=int, default=30, help='viewer refresh rate')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    FrameViewer(args.name, args.fps).run()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Stand-in for Ardour's OSC surface, speaking the subset OscRemoteState uses:
+/set_surface, /set_bank, /strip/list with /reply entries and end_route_list,
+heartbeat, meters and per-strip feedback, echoing strip commands back. For
+load testing without a DAW, eg.
+
+    ./fake_ardour.py --strips 2000 --meter-rate 30 --loss 0.01
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import random
+
+from pythonosc.osc_message_builder import OscMessageBuilder
+from pythonosc.osc_packet import OscPacket, ParseError
+
+
+def fader_to_db(position):
+    'Ardour\'s slider position (0..1) to gain mapping, in dB'
+    if position <= 0:
+        return -math.inf
+    gain = math.exp(((position ** (1/8)) * 198 - 192) / 6 * math.log(2))
+    return 20 * math.log10(gain)
+
+
+class FakeStrip():
+    def __init__(self, ssid, strip_type, name):
+        self.ssid = ssid
+        self.strip_type = strip_type
+        self.name = name
+        self.muted = False
+        self.soloed = False
+        self.recenabled = False
+        self.selected = False
+        self.fader = .78 # ~0 dB
+        self.pan_position = .5
+        self.meter = -70.
+
+    def is_bus(self):
+        return self.strip_type in ('B', 'MB')
+
+
+class FakeSurface():
+    'One registered client, as set up by /set_surface'
+    def __init__(self, address, bank_size, feedback):
+        self.address = address
+        self.bank_size = bank_size
+        self.bank_start = 1
+        self.feedback = feedback
+
+
+class FakeArdour(asyncio.DatagramProtocol):
+
+    SAMPLE_RATE = 48000
+    STRIP_TYPES = ('AT', 'AT', 'AT', 'MT', 'B')
+
+    def __init__(self, strips=16, meter_rate=10., loss_rate=0., session_name='fake_session', seed=None):
+        self.random = random.Random(seed)
+        self.strips = [
+                FakeStrip(ssid, t, f'{t} {ssid}')
+                for ssid, t in ((ssid, self.STRIP_TYPES[(ssid-1) % len(self.STRIP_TYPES)]) for ssid in range(1, strips+1))
+            ]
+        self.master = FakeStrip('master', 'MA', 'Master')
+        self.meter_rate = meter_rate
+        self.loss_rate = loss_rate
+        self.session_name = session_name
+        self.surfaces = {}
+        self.transport = None
+        self.stats = { 'received': 0, 'sent': 0, 'dropped': 0 }
+
+        self.handlers = {
+                '/set_surface': self.on_set_surface,
+                '/set_bank': self.on_set_bank,
+                '/strip/list': self.on_strip_list,
+                '/refresh': self.on_strip_list,
+                '/transport_speed': self.on_transport_speed,
+            }
+        for name in ('fader', 'mute', 'solo', 'recenable', 'select', 'pan_stereo_position'):
+            self.handlers['/strip/' + name] = getattr(self, 'on_strip_' + name)
+            self.handlers['/master/' + name] = getattr(self, 'on_strip_' + name)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        try:
+            packet = OscPacket(data)
+        except ParseError:
+            logging.warning(f'unparsable datagram from {address}')
+            return
+        for timed_message in packet.messages:
+            message = timed_message.message
+            self.stats['received'] += 1
+            handler = self.handlers.get(message.address)
+            if handler is None:
+                logging.debug(f'unhandled {message.address} {message.params!r}')
+                continue
+            handler(address, message.address, *message.params)
+
+    # sending
+
+    def send(self, surface, address, *args):
+        if self.loss_rate and self.random.random() < self.loss_rate:
+            self.stats['dropped'] += 1
+            return
+        builder = OscMessageBuilder(address)
+        for arg in args:
+            builder.add_arg(arg)
+        self.transport.sendto(builder.build().dgram, surface.address)
+        self.stats['sent'] += 1
+
+    def bank_strips(self, surface):
+        'Strips with feedback for the surface, with their surface relative ssid'
+        if not surface.bank_size:
+            return [ (strip.ssid, strip) for strip in self.strips ]
+        first = surface.bank_start - 1
+        return [ (i+1, strip) for i, strip in enumerate(self.strips[first:first+surface.bank_size]) ]
+
+    def surface_ssid(self, surface, strip):
+        if strip is self.master or not surface.bank_size:
+            return strip.ssid
+        ssid = strip.ssid - surface.bank_start + 1
+        return ssid if 1 <= ssid <= surface.bank_size else 0
+
+    def send_strip(self, surface, ssid, name, *args):
+        if ssid == 'master':
+            self.send(surface, '/master/' + name, *args)
+        else:
+            self.send(surface, '/strip/' + name, ssid, *args)
+
+    def send_strip_feedback(self, surface, ssid, strip):
+        self.send_strip(surface, ssid, 'name', strip.name)
+        self.send_strip(surface, ssid, 'mute', int(strip.muted))
+        self.send_strip(surface, ssid, 'solo', int(strip.soloed))
+        if not strip.is_bus():
+            self.send_strip(surface, ssid, 'recenable', int(strip.recenabled))
+        self.send_strip(surface, ssid, 'select', int(strip.selected))
+        self.send_strip(surface, ssid, 'fader', strip.fader)
+        self.send_strip(surface, ssid, 'gain', fader_to_db(strip.fader))
+        self.send_strip(surface, ssid, 'pan_stereo_position', strip.pan_position)
+
+    def send_bank_feedback(self, surface):
+        for ssid, strip in self.bank_strips(surface):
+            self.send_strip_feedback(surface, ssid, strip)
+        self.send_strip_feedback(surface, 'master', self.master)
+
+    # handlers
+
+    def get_surface(self, address):
+        surface = self.surfaces.get(address)
+        if surface is None:
+            # unregistered client, answer with defaults
+            surface = self.surfaces[address] = FakeSurface(address, 0, 0)
+        return surface
+
+    def on_set_surface(self, address, _, bank_size=0, strip_types=0, feedback=0, gainmode=0, se_page=0, pi_page=0, port=0, *args):
+        reply_address = (address[0], port or address[1])
+        surface = FakeSurface(reply_address, bank_size, feedback)
+        self.surfaces[address] = surface
+        logging.info(f'surface {reply_address}: bank size {bank_size}, feedback {feedback}')
+        self.send(surface, '/session_name', self.session_name)
+        self.send_bank_feedback(surface)
+
+    def on_set_bank(self, address, _, bank_start=1, *args):
+        surface = self.get_surface(address)
+        # like OSC::_set_bank, the last bank is moved down to stay full
+        nstrips = len(self.strips)
+        bank_start = int(bank_start)
+        if surface.bank_size and surface.bank_size < nstrips:
+            bank_start = min(bank_start, nstrips - surface.bank_size + 1)
+        elif surface.bank_size:
+            bank_start = 1
+        surface.bank_start = max(1, min(bank_start, nstrips))
+        logging.info(f'surface {surface.address}: bank at {surface.bank_start}')
+        self.send_bank_feedback(surface)
+
+    def on_strip_list(self, address, _, *args):
+        surface = self.get_surface(address)
+        # with banking the list starts at the bank, ssids are bank relative
+        first = surface.bank_start - 1 if surface.bank_size else 0
+        for strip in self.strips[first:]:
+            ssid = self.surface_ssid(surface, strip)
+            if strip.is_bus():
+                self.send(surface, '/reply', strip.strip_type, strip.name, 2, 2, int(strip.muted), int(strip.soloed), ssid)
+            else:
+                self.send(surface, '/reply', strip.strip_type, strip.name, 2, 2, int(strip.muted), int(strip.soloed), ssid, int(strip.recenabled))
+        self.send(surface, '/reply', 'end_route_list', self.SAMPLE_RATE, 0, 0)
+
+    def on_transport_speed(self, address, _, *args):
+        self.send(self.get_surface(address), '/transport_speed', 0.)
+
+    def _strip_command(self, address, osc_address, args):
+        'Strip and surface ssid a command is for, (None, ...) if not a valid strip'
+        surface = self.get_surface(address)
+        if osc_address.startswith('/master/'):
+            return self.master, surface, 'master', args
+        if not args:
+            return None, surface, None, args
+        ssid, *args = args
+        if surface.bank_size and not 1 <= ssid <= surface.bank_size:
+            return None, surface, None, args
+        index = (ssid + surface.bank_start - 2) if surface.bank_size else ssid - 1
+        if not 0 <= index < len(self.strips):
+            return None, surface, None, args
+        return self.strips[index], surface, ssid, args
+
+    def _on_strip_value(self, address, osc_address, args, attribute, convert):
+        strip, surface, ssid, args = self._strip_command(address, osc_address, args)
+        if strip is None or not args:
+            return None
+        setattr(strip, attribute, convert(args[0]))
+        return strip, surface, ssid
+
+    def on_strip_fader(self, address, osc_address, *args):
+        res = self._on_strip_value(address, osc_address, args, 'fader', lambda v: min(max(float(v), 0.), 1.))
+        if res is not None:
+            strip, surface, ssid = res
+            self.send_strip(surface, ssid, 'fader', strip.fader)
+            self.send_strip(surface, ssid, 'gain', fader_to_db(strip.fader))
+
+    def _make_echo_handler(attribute, name, convert):
+        def handler(self, address, osc_address, *args):
+            res = self._on_strip_value(address, osc_address, args, attribute, convert)
+            if res is not None:
+                strip, surface, ssid = res
+                value = getattr(strip, attribute)
+                self.send_strip(surface, ssid, name, int(value) if isinstance(value, bool) else value)
+        return handler
+
+    on_strip_mute = _make_echo_handler('muted', 'mute', bool)
+    on_strip_solo = _make_echo_handler('soloed', 'solo', bool)
+    on_strip_recenable = _make_echo_handler('recenabled', 'recenable', bool)
+    on_strip_select = _make_echo_handler('selected', 'select', bool)
+    on_strip_pan_stereo_position = _make_echo_handler('pan_position', 'pan_stereo_position', float)
+    del _make_echo_handler
+
+    # periodic feedback
+
+    async def run_heartbeat(self):
+        beat = 1.
+        while True:
+            await asyncio.sleep(1)
+            for surface in list(self.surfaces.values()):
+                self.send(surface, '/heartbeat', beat)
+            beat = 1. - beat
+
+    async def run_meters(self):
+        if not self.meter_rate:
+            return
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.meter_rate
+        next_time = loop.time()
+        while True:
+            next_time += interval
+            await asyncio.sleep(max(next_time - loop.time(), 0))
+
+            # random walk, only sending changed values like Ardour does
+            changed = set()
+            for strip in self.strips + [self.master]:
+                meter = min(max(strip.meter + self.random.uniform(-6., 6.), -70.), 3.)
+                if meter != strip.meter:
+                    strip.meter = meter
+                    changed.add(strip)
+
+            for surface in list(self.surfaces.values()):
+                for ssid, strip in self.bank_strips(surface):
+                    if strip in changed:
+                        self.send(surface, '/strip/meter', ssid, strip.meter)
+                self.send(surface, '/master/meter', self.master.meter)
+
+    async def run_stats(self, interval=5.):
+        last = dict(self.stats)
+        while True:
+            await asyncio.sleep(interval)
+            rates = ', '.join(f'{key} {(self.stats[key] - last[key]) / interval:.0f}/s' for key in self.stats)
+            logging.info(f'{len(self.surfaces)} surface(s), {rates}')
+            last = dict(self.stats)
+
+    async def serve(self, host='localhost', port=3819):
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        logging.info(f'fake Ardour with {len(self.strips)} strips on {host}:{port}')
+        await asyncio.gather(self.run_heartbeat(), self.run_meters(), self.run_stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Ardour OSC server for load testing')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=3819)
+    parser.add_argument('--strips', type=int, default=16, help='number of strips')
+    parser.add_argument('--meter-rate', type=float, default=10., help='meter updates per second and strip, 0 to disable')
+    parser.add_argument('--loss', type=float, default=0., help='fraction of sent datagrams to drop')
+    parser.add_argument('--seed', type=int, default=None, help='random seed, for reproducible runs')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    fake = FakeArdour(strips=args.strips, meter_rate=args.meter_rate, loss_rate=args.loss, seed=args.seed)
+    try:
+        asyncio.run(fake.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import mmap
+import os
+import struct
+
+# Both screens' framebuffers in a shared memory segment (a file in /dev/shm),
+# so a viewer in a different process can display them without costing the
+# controller more than a memcpy per frame.
+#
+# Layout:
+#   0:   header (magic, width, height, screen count)
+#   16:  one uint64 sequence counter per screen, odd while the frame is written
+#   64:  RGB16_565 frame data, one frame per screen
+
+DEFAULT_NAME = 'nikontrol_frames'
+
+WIDTH = 480
+HEIGHT = 272
+SCREENS = 2
+FRAME_SIZE = WIDTH * HEIGHT * 2
+
+_MAGIC = b'NIKF'
+_HEADER = struct.Struct('<4sHHH')
+_COUNTER = struct.Struct('<Q')
+_COUNTER_OFFSET = 16
+_DATA_OFFSET = 64
+
+SEGMENT_SIZE = _DATA_OFFSET + SCREENS * FRAME_SIZE
+
+
+def _segment_path(name):
+    return os.path.join('/dev/shm', name)
+
+
+class SharedFrameBuffer():
+    """
+    Seqlock protected framebuffers. The writing side creates (and on close
+    removes) the segment, readers map it read-only.
+    """
+
+    def __init__(self, name=DEFAULT_NAME, create=False):
+        self.name = name
+        self.path = _segment_path(name)
+        self.owner = create
+
+        if create:
+            # always a new file renamed into place, never truncating the one of
+            # a crashed owner: a viewer still mapping it would get SIGBUS, and
+            # only a new inode lets it notice the restart (is_stale)
+            tmp_path = f'{self.path}.{os.getpid()}'
+            fd = os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_RDWR, 0o644)
+            try:
+                os.ftruncate(fd, SEGMENT_SIZE)
+                self._mm = mmap.mmap(fd, SEGMENT_SIZE)
+                self.inode = os.fstat(fd).st_ino
+                _HEADER.pack_into(self._mm, 0, _MAGIC, WIDTH, HEIGHT, SCREENS)
+                os.rename(tmp_path, self.path)
+            except Exception:
+                if hasattr(self, '_mm'):
+                    self._mm.close()
+                os.unlink(tmp_path)
+                raise
+            finally:
+                os.close(fd)
+
+        else:
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                self._mm = mmap.mmap(fd, SEGMENT_SIZE, access=mmap.ACCESS_READ)
+                self.inode = os.fstat(fd).st_ino
+            finally:
+                os.close(fd)
+            magic, width, height, screens = _HEADER.unpack_from(self._mm, 0)
+            if magic != _MAGIC or (width, height, screens) != (WIDTH, HEIGHT, SCREENS):
+                self._mm.close()
+                raise ValueError(f'{self.path} is not a nikontrol frame buffer')
+
+    def _get_counter(self, screen):
+        return _COUNTER.unpack_from(self._mm, _COUNTER_OFFSET + 8*screen)[0]
+
+    def _set_counter(self, screen, value):
+        _COUNTER.pack_into(self._mm, _COUNTER_OFFSET + 8*screen, value)
+
+    def write(self, screen, data):
+        counter = self._get_counter(screen)
+        offset = _DATA_OFFSET + screen * FRAME_SIZE
+        self._set_counter(screen, counter + 1)
+        self._mm[offset:offset + FRAME_SIZE] = data
+        self._set_counter(screen, counter + 2)
+
+    def get_frame_number(self, screen):
+        return self._get_counter(screen) // 2
+
+    def read(self, screen, retries=10):
+        """
+        Return (frame_number, data) of a consistent copy of the screen's
+        framebuffer.
+        """
+        offset = _DATA_OFFSET + screen * FRAME_SIZE
+        for _ in range(retries):
+            before = self._get_counter(screen)
+            if before & 1:
+                continue
+            data = self._mm[offset:offset + FRAME_SIZE]
+            if self._get_counter(screen) == before:
+                return before // 2, data
+        raise BlockingIOError('frame buffer is being written continuously')
+
+    def is_stale(self):
+        'The segment was unlinked or recreated by a restarted owner'
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except FileNotFoundError:
+            return True
+
+    def close(self):
+        self._mm.close()
+        if self.owner and not self.is_stale():
+            # not if another owner replaced it already
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
@@ -1,6 +1,7 @@
 #!/usr/bin/python
 
 import cairo
+import functools
 import logging
 import math
 
@@ -10,6 +11,50 @@ def _fill_background(ctx, ims):
     ctx.rectangle(0, 0, ims.get_width(), ims.get_height())
     ctx.fill()
 
+def meter_deflection(db):
+    'Meter bar fraction (0..1) for a dB value, like Ardour\'s log_meter'
+    if db < -70:
+        d = 0
+    elif db < -60:
+        d = (db + 70) * .25
+    elif db < -50:
+        d = (db + 60) * .5 + 2.5
+    elif db < -40:
+        d = (db + 50) * .75 + 7.5
+    elif db < -30:
+        d = (db + 40) * 1.5 + 15
+    elif db < -20:
+        d = (db + 30) * 2 + 30
+    elif db < 6:
+        d = (db + 20) * 2.5 + 50
+    else:
+        d = 115
+    return d / 115
+
+# lookup tables for the strip bars, value -> bar height in pixels
+METER_BAR_HEIGHT = 160
+_METER_LUT_MIN_DB = -70
+_METER_LUT_STEPS = 4 # per dB
+_METER_LUT = [ round(meter_deflection(_METER_LUT_MIN_DB + i/_METER_LUT_STEPS) * METER_BAR_HEIGHT) for i in range((6 - _METER_LUT_MIN_DB) * _METER_LUT_STEPS + 1) ]
+_FADER_LUT_SIZE = 1024
+_FADER_LUT = [ round(i / (_FADER_LUT_SIZE-1) * METER_BAR_HEIGHT) for i in range(_FADER_LUT_SIZE) ]
+
+def meter_pixels(db):
+    if not db > _METER_LUT_MIN_DB: # also NaN
+        return 0
+    i = int((db - _METER_LUT_MIN_DB) * _METER_LUT_STEPS)
+    return _METER_LUT[i] if i < len(_METER_LUT) else METER_BAR_HEIGHT
+
+def fader_pixels(fader):
+    if not fader > 0:
+        return 0
+    return _FADER_LUT[min(int(fader * (_FADER_LUT_SIZE-1) + .5), _FADER_LUT_SIZE-1)]
+
+@functools.lru_cache(maxsize=4096)
+def _format_db(gain):
+    'Call with the gain rounded to the displayed precision'
+    return f'{gain:.2f} dB'
+
 def _draw_title_bar(ctx, title):
     'Assumes full width ctx'
     ctx.set_source_rgb(.2, .2, .1)
@@ -81,6 +126,12 @@ def _draw_hierarchy_string(ctx, entries, offset):
     ctx.show_text(entry)
 
 
+def surface_from_rgb565(data, width=480, height=272):
+    'Wrap raw frame data (eg. from shared memory) in a cairo surface'
+    stride = cairo.ImageSurface.format_stride_for_width(cairo.Format.RGB16_565, width)
+    return cairo.ImageSurface.create_for_data(bytearray(data), cairo.Format.RGB16_565, width, height, stride)
+
+
 class CrossDrawer():
 
     def __init__(self):
@@ -146,23 +197,47 @@ class StripBankDrawer():
     def __init__(self, osc_state):
         self.osc_state = osc_state
         self.strips = []
+        self._frame = None # (strips, session name) taken by get_tile_jobs
         self.ims = cairo.ImageSurface(cairo.Format.RGB16_565, 480, 272)
 
     def set_strip_list(self, lst):
         # self.strips = [StripDrawer(strip) for strip in lst]
         self.strips = list(lst)
 
+    def get_tile_jobs(self):
+        """
+        Takes the values of the frame (on the event loop) and returns the
+        jobs for the strip tiles that need redrawing, to run in parallel
+        before draw().
+        """
+        strips = list(self.strips)
+        self._frame = (strips, self.osc_state.get('session_name', '-'))
+        dirty = [ strip for strip in strips if strip.dirty ]
+        store = getattr(self.osc_state, 'strip_store', None)
+        if store is not None:
+            # one column-wise read of the store for the whole bank
+            states = store.read_rows([ strip.strip_state.row for strip in dirty ])
+        else:
+            # plain dicts in the render process
+            states = [ None ] * len(dirty)
+        return [ strip.get_draw_job(state) for strip, state in zip(dirty, states) ]
+
     # def read_updated_strip_data(self, ssid):
     #     for strip in self.strips:
     #         if strip.strip_state.ssid == ssid:
     #             strip.update()
 
     def draw(self):
+        if self._frame is None:
+            # not prepared by get_tile_jobs, draw everything here
+            for job in self.get_tile_jobs():
+                job()
+        (strips, session_name), self._frame = self._frame, None
 
         ctx = cairo.Context(self.ims)
         _fill_background(ctx, self.ims)
 
-        if not self.strips:
+        if not strips:
             ctx.set_source_rgb(1, 0, 0)
             ctx.move_to(0, 0)
             ctx.line_to(479, 271)
@@ -172,8 +247,7 @@ class StripBankDrawer():
             ctx.stroke()
 
         else:
-            for i, strip in enumerate(self.strips):
-                strip.draw()
+            for i, strip in enumerate(strips):
                 ctx.set_source_surface(strip.ims, 120*i, 0)
                 ctx.paint()
 
@@ -183,7 +257,6 @@ class StripBankDrawer():
             ctx.fill()
 
             font_size = 12
-            session_name = self.osc_state.get('session_name', '-')
             ctx.select_font_face('sans-serif')
             ctx.set_font_size(font_size)
             ctx.set_source_rgb(1, 1, 1)
@@ -193,6 +266,10 @@ class StripBankDrawer():
 class StripDrawer():
     DEFAULT_UI_COLOR = ((.7, .7, .7), (.2, .2, .2))
     HIGHLIGHT_UI_COLOR = ((.7, .4, .0), (.2, .1, .0))
+    FONT_SIZE = 8
+
+    # text -> extents in the strip font, shared by all strips
+    _text_extents = {}
 
     def __init__(self, strip_state):
         self.strip_state = strip_state
@@ -214,7 +291,7 @@ class StripDrawer():
         ctx.fill()
 
         if text:
-            text_x, text_y, text_width, text_height, text_dx, text_dy = ctx.text_extents(text)
+            text_x, text_y, text_width, text_height, text_dx, text_dy = self._get_text_extents(ctx, text)
             ctx.set_source_rgb(*text_color)
             ctx.move_to(x + width/2 - text_width/2 - text_x, y + height/2 - text_height/2 - text_y)
             ctx.show_text(text)
@@ -231,13 +308,33 @@ class StripDrawer():
         ctx.rectangle(x + width/2, y, width*(value-.5), height)
         ctx.fill()
 
-    def _draw_meter_bar(self, ctx, x, y, width, height, bg_color, fg_color, value):
-        ctx.set_source_rgb(*bg_color)
-        ctx.rectangle(x, y, width, height)
-        ctx.fill()
-        ctx.set_source_rgb(*fg_color)
-        ctx.rectangle(x, y + height - value*height, width, value*height)
-        ctx.fill()
+    def _get_text_extents(self, ctx, text):
+        extents = self._text_extents.get(text)
+        if extents is None:
+            if len(self._text_extents) > 4096:
+                self._text_extents.clear()
+            extents = self._text_extents[text] = tuple(ctx.text_extents(text))
+        return extents
+
+    def _draw_meter_bar(self, ctx, x, y, width, height, bg_color, fg_color, pixels):
+        # background only where the bar isn't
+        if pixels < height:
+            ctx.set_source_rgb(*bg_color)
+            ctx.rectangle(x, y, width, height - pixels)
+            ctx.fill()
+        if pixels:
+            ctx.set_source_rgb(*fg_color)
+            ctx.rectangle(x, y + height - pixels, width, pixels)
+            ctx.fill()
+
+    def _draw_peak_meter(self, ctx, x, y, width, height, level, peak):
+        self._draw_meter_bar(ctx, x, y, width, height, (.2, .2, .2), (.2, .7, .2), meter_pixels(level))
+        peak_pixels = meter_pixels(peak)
+        if peak_pixels:
+            # clipping in red
+            ctx.set_source_rgb(*((.9, .2, .2) if peak > 0 else (.8, .8, .8)))
+            ctx.rectangle(x, y + height - peak_pixels, width, 2)
+            ctx.fill()
 
     def _draw_highlighting(self, ctx, color):
         W = 20
@@ -256,33 +353,49 @@ class StripDrawer():
     def update(self):
         self.dirty = True
 
-    def draw(self):
+    def get_draw_job(self, state=None):
+        """
+        Job drawing the tile, None if nothing changed. The values are taken
+        now (on the event loop, unless already read for the bank), so a tile
+        drawn in a render thread never mixes values from before and after an
+        update, or shows those of a recycled store row.
+        """
         if not self.dirty:
-            return
+            return None
         self.dirty = False
+        if state is None:
+            # a plain dict in the render process
+            state = self.strip_state if isinstance(self.strip_state, dict) else self.strip_state.snapshot()
+        highlight = self.highlight
+        return lambda: self._draw(state, highlight)
+
+    def draw(self):
+        job = self.get_draw_job()
+        if job is not None:
+            job()
 
-        font_size = 8
+    def _draw(self, state, highlight):
+        font_size = self.FONT_SIZE
         ctx = cairo.Context(self.ims)
         ctx.select_font_face('sans-serif')
         ctx.set_font_size(font_size)
         _fill_background(ctx, self.ims)
 
         # color selected strip
-        if self.strip_state.get('selected'):
+        if state.get('selected'):
             self._draw_highlighting(ctx, (.75, 0, 0))
-        elif self.highlight:
+        elif highlight:
             self._draw_highlighting(ctx, (.75, .4, 0))
 
         # strip name
-        name = self.strip_state.get('name', '')
-        text_x, text_y, text_width, text_height, text_dx, text_dy = ctx.text_extents(name)
+        name = state.get('name', '')
         ctx.set_source_rgb(1, 1, 1)
         ctx.move_to(5, 5 + font_size)
         ctx.show_text(name)
 
         # mute and solo buttons
-        muted = self.strip_state.get('muted', False)
-        soloed = self.strip_state.get('soloed', False)
+        muted = state.get('muted', False)
+        soloed = state.get('soloed', False)
         muted_bg = (.7, .2, .2) if muted else (.2, .2, .2)
         muted_tc = (1, 1, 1) if muted else (.5, .5, .5)
         soloed_bg = (.7, .7, .2) if soloed else (.2, .2, .2)
@@ -291,31 +404,36 @@ class StripDrawer():
         self._draw_button(ctx, 20, 20, 10, 10, soloed_bg, soloed_tc, 'S')
 
         # pan bar
-        pan_color_fg, pan_color_bg = self.HIGHLIGHT_UI_COLOR if self.highlight else self.DEFAULT_UI_COLOR
-        pan = 1 - self.strip_state.get('pan_position', .5)
+        pan_color_fg, pan_color_bg = self.HIGHLIGHT_UI_COLOR if highlight else self.DEFAULT_UI_COLOR
+        pan = 1 - state.get('pan_position', .5)
         self._draw_pan_bar(ctx, 20, 45, 80, 5, pan_color_bg, pan_color_fg, pan)
 
         # gain fader calculation
-        gain_color_fg, gain_color_bg = self.HIGHLIGHT_UI_COLOR if self.highlight else self.DEFAULT_UI_COLOR
-        # if self.highlight:
+        gain_color_fg, gain_color_bg = self.HIGHLIGHT_UI_COLOR if highlight else self.DEFAULT_UI_COLOR
+        # if highlight:
         #     gain_color_fg, gain_color_bg = ((.9, .9, .9), (.4, .4, .4))
         # else:
         #     gain_color_fg, gain_color_bg = ((.4, .4, .4), (.2, .2, .2))
-        gain = self.strip_state.get('gain', math.inf)
+        gain = state.get('gain', math.inf)
         # print value
-        db_msg = f'{gain:.2f} dB'
-        text_x, text_y, text_width, text_height, text_dx, text_dy = ctx.text_extents(db_msg)
+        db_msg = _format_db(round(gain, 2))
+        text_x, text_y, text_width, text_height, text_dx, text_dy = self._get_text_extents(ctx, db_msg)
         ctx.set_source_rgb(1, 1, 1)
         ctx.move_to(60 - text_width/2 - text_x, 85 - (10 - font_size)/2)
         ctx.show_text(db_msg)
         # draw fader
-        fader = max(self.strip_state.get('fader', 0), 0)
-        self._draw_meter_bar(ctx, 50, 85, 20, 160, gain_color_bg, gain_color_fg, fader)
-
-        # peak meter bar
-        meter = max(self.strip_state.get('meter', 0), 0)
-        self._draw_meter_bar(ctx, 35, 85, 10, 160, (.2, .2, .2), (.2, .7, .2), meter)
-        self._draw_meter_bar(ctx, 75, 85, 10, 160, (.2, .2, .2), (.2, .7, .2), meter)
+        fader = state.get('fader', 0)
+        self._draw_meter_bar(ctx, 50, 85, 20, METER_BAR_HEIGHT, gain_color_bg, gain_color_fg, fader_pixels(fader))
+
+        # peak meter bars, Ardour sends one (dB) value per strip. Without the
+        # MeterProcessor (meter_rate=0) only the raw value is there.
+        level = state.get('meter_level')
+        if level is None:
+            level = peak = state.get('meter', -math.inf)
+        else:
+            peak = state.get('meter_peak', level)
+        self._draw_peak_meter(ctx, 35, 85, 10, METER_BAR_HEIGHT, level, peak)
+        self._draw_peak_meter(ctx, 75, 85, 10, METER_BAR_HEIGHT, level, peak)
 
 
 def main_gui():
@@ -12,10 +12,7 @@ if TYPE_CHECKING:
 import math
 import time
 
-import gui_debug
-import gui_hw
 import gui
-import osc_state
 import util
 import views
 
@@ -81,16 +78,10 @@ class KnightRiderView(views.View):
         self.lkr_drawer.set_pos(self.pos)
         self.rkr_drawer.set_pos(self.pos)
 
-        self.cross_drawer.draw()
-        self.lkr_drawer.draw()
-        self.rkr_drawer.draw()
-
         if self.state >= 3:
-            logic.upload_image(0, 0, 0, self.lkr_drawer.ims)
-            logic.upload_image(1, 0, 0, self.rkr_drawer.ims)
+            logic.render_screens(self.lkr_drawer, self.rkr_drawer)
         else:
-            logic.upload_image(0, 0, 0, self.cross_drawer.ims)
-            logic.upload_image(1, 0, 0, self.cross_drawer.ims)
+            logic.render_screens(self.cross_drawer, self.cross_drawer)
 
 
 
@@ -1,5 +1,8 @@
 #!/usr/bin/python
 
+import time
+_start_time = time.perf_counter()
+
 import asyncio
 import logging
 
@@ -7,21 +10,106 @@ from typing import *
 
 import struct
 
-import gui_debug
-import gui_hw
-import gui
-import osc_state
+import profiling
+import render
 import util
-import views
+
+# views (gui, cairo), gui_debug (gi/Gtk), gui_hw (pyusb) and osc_state
+# (python-osc) are imported lazily on first use, see Logic.init and
+# ArdourOscLogic.__init__. render only needs the standard library.
+
+class FaderTargets():
+    """
+    Accumulates knob deltas per strip into a pending fader target, instead of
+    adding each delta to the last value echoed back by Ardour. Targets are
+    sent at most every interval seconds, and dropped once Ardour's feedback
+    caught up (or didn't for settle_time, then Ardour's value wins).
+    """
+
+    def __init__(self, ardour_logic, interval=.01, settle_time=.5):
+        self.ardour_logic = ardour_logic
+        self.interval = interval
+        self.settle_time = settle_time
+        self.targets = {} # ssid -> [strip_state, target, last_sent, last_change_time]
+        self._flush_handle = None
+        self._last_flush = 0
+
+    def get_target(self, ssid, default=None):
+        entry = self.targets.get(ssid)
+        return entry[1] if entry is not None else default
+
+    def add_delta(self, strip_state, delta):
+        now = time.monotonic()
+        entry = self.targets.get(strip_state.ssid)
+        if entry is None or entry[0] is not strip_state:
+            entry = [strip_state, strip_state.get_confirmed('fader', 0), None, now]
+            self.targets[strip_state.ssid] = entry
+
+        entry[1] = min(max(entry[1] + delta, 0.), 1.)
+        entry[3] = now
+        strip_state.predict('fader', entry[1])
+        self._schedule(max(self._last_flush + self.interval - now, 0))
+
+    def _schedule(self, delay):
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._flush_handle is not None:
+            if self._flush_handle.when() <= when:
+                return
+            # only the settle timeout is pending, send earlier
+            self._flush_handle.cancel()
+        self._flush_handle = loop.call_at(when, self.flush)
+
+    def flush(self):
+        self._flush_handle = None
+        now = time.monotonic()
+        self._last_flush = now
+
+        for ssid, entry in list(self.targets.items()):
+            strip_state, target, last_sent, last_change = entry
+            if not strip_state.is_valid():
+                # strip removed in the meantime
+                del self.targets[ssid]
+            elif target != last_sent:
+                entry[2] = target
+                self.ardour_logic.send_strip_command(strip_state, '/fader', target)
+            elif now - last_change > self.settle_time:
+                # no matching feedback, give up and show Ardour's value again
+                del self.targets[ssid]
+
+        if self.targets:
+            self._schedule(self.settle_time)
+
+    def reconcile(self, ssids):
+        'Called with changed strips, drop targets confirmed by feedback'
+        for ssid in ssids:
+            entry = self.targets.get(ssid)
+            if entry is None or entry[1] != entry[2]:
+                continue
+            if not entry[0].is_valid():
+                del self.targets[ssid]
+                continue
+            if abs(entry[0].get_confirmed('fader', -1) - entry[1]) < 1e-4:
+                del self.targets[ssid]
 
 class ArdourOscLogic():
 
+    # only subscribe to feedback of the strips shown on one StripView page
+    BANK_SIZE = 8
+
     def __init__(self, logic):
         self.logic = logic
-        self.ors = osc_state.OscRemoteState()
+        osc_state = logic.profiler.import_module('osc_state')
+        self.ors = osc_state.OscRemoteState(bank_size=self.BANK_SIZE, snapshot_path=osc_state.DEFAULT_SNAPSHOT_PATH)
         self.ors.register_changed_callback(self._osc_callback)
+        if logic.profile_osc:
+            self.ors.set_traffic_profiler(profiling.OscTrafficProfiler())
         self._ors_server_task = None
+        self.fader_targets = FaderTargets(self)
+        views = logic.profiler.import_module('views')
         self.strip_view = views.StripView(self)
+        # last session's strips, shown until Ardour answers
+        self.ors.load_snapshot()
 
     def connect(self):
         self._ors_server_task = asyncio.create_task(self.ors.start_server())
@@ -33,9 +121,9 @@ class ArdourOscLogic():
         await self._ors_server_task
 
     def _osc_callback(self, event_type, *args):
+        # called once per event type and loop tick with the collected changes,
+        # the view triggers redraws if it's affected
         self.on_osc_event(event_type, *args)
-        self.logic.redraw_trigger.trigger()
-        self.logic.config_trigger.trigger()
 
     def on_osc_event(self, event_type, *args):
         return self.strip_view.on_osc_event(self, event_type, *args)
@@ -50,12 +138,32 @@ class ArdourOscLogic():
         if strip.ssid == 'master':
             self.ors.client.send_message('/master' + address, args)
         else:
-            self.ors.client.send_message('/strip' + address, (strip.ssid, *args))
+            ssid = self.ors.to_surface_ssid(strip.ssid)
+            if ssid is None:
+                logging.warning(f'strip {strip.ssid} is not in the current bank, dropping {address}')
+                return
+            self.ors.client.send_message('/strip' + address, (ssid, *args))
+
+    def set_page(self, page_index):
+        'Follow the visible StripView page with the feedback bank'
+        self.ors.set_bank(page_index * self.BANK_SIZE + 1)
 
 class Logic():
 
-    def __init__(self):
+    def __init__(self, headless=False, publish_frames=False, render_threads=2, use_render_process=False, preconnect=False, profile_startup=False, profile_osc=False):
+        self.headless = headless
+        self.profile_osc = profile_osc
+        self.preconnect = preconnect
+        self.publish_frames = publish_frames
+        self.frame_buffer = None
+        self.render_executor = render.RenderExecutor(render_threads)
+        self.use_render_process = use_render_process
+        self.render_process = None
+        self._render_task = None
+        self._redraw_pending = False
         self.last_io_state = None
+        self.profiler = profiling.StartupProfiler(_start_time, enabled=profile_startup)
+        self.profiler.mark('main imported')
 
         self.keyzone_config = [util.KeyZoneConfig()] + [util.KeyZoneConfig(off=True) for _ in range(11)]
         self.keyzone_config_dirty = True
@@ -72,10 +180,28 @@ class Logic():
 
     def init(self):
 
+        gui_hw = self.profiler.import_module('gui_hw')
+
+        # cairo is needed for the first frame anyway (GlobalView), but its
+        # import shows up in the startup profile and runs after loop setup
+        views = self.profiler.import_module('views')
         self.global_view = views.GlobalView(self)
         self.view_list = [self.global_view]
-        self.debug_gui = gui_debug.DebugWindow(self._window_close_callback, self._keystate_cb)
+        if self.headless:
+            self.debug_gui = None
+        else:
+            gui_debug = self.profiler.import_module('gui_debug')
+            self.debug_gui = gui_debug.DebugWindow(self._window_close_callback, self._keystate_cb)
+        if self.publish_frames:
+            # for debug_viewer.py running in another process
+            frame_shm = self.profiler.import_module('frame_shm')
+            self.frame_buffer = frame_shm.SharedFrameBuffer(create=True)
         self.device_gui = gui_hw.DeviceWindow(self._keystate_cb)
+        if self.use_render_process:
+            render_process = self.profiler.import_module('render_process')
+            self.render_process = render_process.RenderProcess(self)
+            self.render_process.start()
+        self.profiler.mark('init done')
         # self.redraw_trigger = util.AsyncTrigger(.01, .1, lambda: self.draw())
         # self.config_trigger = util.AsyncTrigger(.01, .1, lambda: self._upload_options_callback())
         self.redraw_trigger = util.AsyncTrigger(.01, .02, lambda: self.draw())
@@ -86,8 +212,17 @@ class Logic():
 
         self.exit_event = asyncio.Event()
 
+        if self.preconnect:
+            # handshake and strip list in the background, so the strip view is ready on first Midi press
+            self.ensure_ardour()
+
     def run(self):
-        gui_debug.init_for_asyncio()
+        if self.headless:
+            self._init_headless_loop()
+        else:
+            gui_debug = self.profiler.import_module('gui_debug')
+            gui_debug.init_for_asyncio()
+        self.profiler.mark('event loop installed')
 
         async def main_task():
             await self.exit_event.wait()
@@ -95,6 +230,15 @@ class Logic():
         async def asyncio_logic():
             self.init()
 
+            if self.headless:
+                # no window to close, quit cleanly when stopped as a service
+                import signal
+                asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self._window_close_callback)
+
+            if self.profile_osc:
+                import signal
+                asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, self.report_osc_traffic)
+
             done, pending = await asyncio.wait([
                     # asyncio.create_task(self.ors.start_server()),
                     asyncio.create_task(self.device_gui.run_input_loop()),
@@ -114,6 +258,9 @@ class Logic():
                 self._window_close_callback()
                 await asyncio.wait(pending)
 
+            if self.render_process is not None:
+                self.render_process.stop()
+
         try:
             asyncio.run(asyncio_logic())
 
@@ -121,8 +268,30 @@ class Logic():
             # just raise again, let the application quit/crash
             raise
 
+        finally:
+            self.render_executor.shutdown()
+            if self.frame_buffer is not None:
+                self.frame_buffer.close()
+
         # Gtk.main_quit()
 
+    def _init_headless_loop(self):
+        # plain asyncio loop, use uvloop if it is installed
+        try:
+            uvloop = self.profiler.import_module('uvloop')
+        except ImportError:
+            logging.info('headless mode, using default asyncio event loop')
+        else:
+            logging.info('headless mode, using uvloop')
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    def report_osc_traffic(self):
+        'Log the OSC traffic profile, with --profile-osc'
+        if self.ardour_logic is None or self.ardour_logic.ors.traffic_profiler is None:
+            logging.info('no osc traffic profile')
+            return
+        self.ardour_logic.ors.traffic_profiler.report()
+
     def ensure_ardour(self):
         if not self.ardour_logic:
             self.ardour_logic = ArdourOscLogic(self)
@@ -154,10 +323,43 @@ class Logic():
             if view.draw(self):
                 return
 
+    def render_screens(self, left, right):
+        """
+        Draw both screens' drawers concurrently and upload them once both are
+        finished. Returns True, to be used as the result of View.draw.
+        """
+        if self._render_task is not None:
+            # previous frame still in flight, draw again once it is uploaded
+            self._redraw_pending = True
+            return True
+
+        self._render_task = asyncio.create_task(self._render_and_upload(left, right))
+        return True
+
+    async def _render_and_upload(self, left, right):
+        try:
+            await self.render_executor.render([left, right])
+            self.upload_image(0, 0, 0, left.ims)
+            self.upload_image(1, 0, 0, right.ims)
+
+        finally:
+            self._render_task = None
+            if self._redraw_pending:
+                self._redraw_pending = False
+                self.redraw_trigger.trigger()
+
     def upload_image(self, screen, x_pos, y_pos, ims):
-        self.debug_gui.upload_image(screen, x_pos, y_pos, ims)
+        if self.debug_gui is not None:
+            self.debug_gui.upload_image(screen, x_pos, y_pos, ims)
+        if self.frame_buffer is not None:
+            self.frame_buffer.write(screen, ims.get_data())
         self.device_gui.upload_image(screen, x_pos, y_pos, ims)
 
+        if not self.profiler.reported:
+            self.profiler.mark(f'first frame uploaded (screen {screen})')
+            if screen == 1:
+                self.profiler.report()
+
     def _window_close_callback(self, *args):
         # self.ors.transport.close()
         self.device_gui.stop_input_loop()
@@ -311,7 +513,19 @@ class Logic():
 # /strip/state  give type and other info
 
 if __name__ == "__main__":
+    import argparse
     import logging
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--headless', action='store_true', help='run without the GTK debug window')
+    parser.add_argument('--publish-frames', action='store_true', help='publish frames to shared memory for debug_viewer.py')
+    parser.add_argument('--render-threads', type=int, default=2, help='render threads, 0 draws on the event loop')
+    parser.add_argument('--render-process', action='store_true', help='draw the strip view in a separate process')
+    parser.add_argument('--preconnect', action='store_true', help='connect to Ardour in the background at startup')
+    parser.add_argument('--profile-startup', action='store_true', help='log import times and time to first frame')
+    parser.add_argument('--profile-osc', action='store_true', help='profile received OSC traffic per address, logged on SIGUSR1 or Shift+Clear in the strip view')
+    args = parser.parse_args()
+
     logging.basicConfig(level=logging.DEBUG)
-    logic = Logic()
+    logic = Logic(headless=args.headless, publish_frames=args.publish_frames, render_threads=args.render_threads, use_render_process=args.render_process, preconnect=args.preconnect, profile_startup=args.profile_startup, profile_osc=args.profile_osc)
     logic.run()
@@ -0,0 +1,133 @@
+import asyncio
+import collections
+import math
+
+
+class MeterProcessor():
+    """
+    Meter stage between Ardour's /strip/meter feedback (METER_DB) and the
+    ui. Raw values are collected per strip and published at a fixed rate as
+    'meter_level' (with attack/release ballistics) and 'meter_peak' (held,
+    then decaying), so the redraw rate doesn't depend on Ardour's send rate.
+
+    All values are in dB, floored at MIN_DB.
+    """
+
+    MIN_DB = -70.
+
+    def __init__(self, ors, rate=30, buffer_size=64, attack=.005, release=20., peak_hold=1.5, peak_decay=15.):
+        self.ors = ors
+        self.interval = 1 / rate
+        self.buffer_size = buffer_size
+        # attack: time constant in seconds, release and peak decay: dB per second
+        self.attack = attack
+        self.release = release
+        self.peak_hold = peak_hold
+        self.peak_decay = peak_decay
+
+        # ssid -> deque of raw values received since the last publish
+        self.samples = {}
+        # ssid -> [level, peak, peak hold end time, last raw value]
+        self.meters = {}
+        self._task = None
+        self._last_time = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def push(self, ssid, value):
+        buffer = self.samples.get(ssid)
+        if buffer is None:
+            buffer = self.samples[ssid] = collections.deque(maxlen=self.buffer_size)
+        buffer.append(value)
+
+    def forget(self, ssid):
+        'Drop the state of one strip, eg. when its ssid now holds another route'
+        self.samples.pop(ssid, None)
+        self.meters.pop(ssid, None)
+
+    def reset(self):
+        'Forget all meter values, eg. after packet loss'
+        self.samples.clear()
+        self.meters.clear()
+        for strip in self.ors.strips.values():
+            changed = strip.set('meter_level', math.nan)
+            changed |= strip.set('meter_peak', math.nan)
+            if changed:
+                self.ors.on_strip_changed(strip)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        self._last_time = loop.time()
+        next_time = self._last_time
+        while True:
+            next_time += self.interval
+            await asyncio.sleep(max(next_time - loop.time(), 0))
+            now = loop.time()
+            if now - next_time > self.interval:
+                # fell behind, don't try to catch up
+                next_time = now
+            self.publish(now)
+
+    def publish(self, now):
+        dt = now - self._last_time if self._last_time is not None else self.interval
+        self._last_time = now
+        attack_coef = 1 - math.exp(-dt / self.attack) if self.attack > 0 else 1.
+
+        strips = self.ors.strips
+        samples = self.samples
+        for ssid in set(samples) | set(self.meters):
+            strip = strips.get(ssid)
+            if strip is None:
+                samples.pop(ssid, None)
+                self.meters.pop(ssid, None)
+                continue
+
+            buffer = samples.get(ssid)
+            if buffer:
+                # decimate to the loudest value of the interval
+                value = max(max(buffer), self.MIN_DB)
+                buffer.clear()
+            else:
+                value = None
+
+            meter = self.meters.get(ssid)
+            if meter is None:
+                if value is None:
+                    continue
+                meter = self.meters[ssid] = [self.MIN_DB, self.MIN_DB, now, value]
+            level, peak, hold_end, last = meter
+
+            # Ardour only sends changed values, without new ones the last
+            # value still holds
+            if value is None:
+                value = last
+
+            if value > level:
+                level += (value - level) * attack_coef
+            else:
+                level = max(level - self.release * dt, value)
+
+            if value >= peak:
+                peak = value
+                hold_end = now + self.peak_hold
+            elif now > hold_end:
+                peak = max(peak - self.peak_decay * dt, level)
+
+            if value <= self.MIN_DB and level <= self.MIN_DB and peak <= self.MIN_DB:
+                # silent and fully decayed, nothing to update until the next value
+                del self.meters[ssid]
+                samples.pop(ssid, None)
+            else:
+                meter[:] = level, peak, hold_end, value
+
+            changed = strip.set('meter_level', level)
+            changed |= strip.set('meter_peak', peak)
+            if changed:
+                self.ors.on_strip_changed(strip)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Capture OSC datagrams to a compact binary log, or print them. Replaces
+osc_dumper.py, keeps up with meter traffic.
+
+    ./osc_capture.py 9100 --surface -o session.osclog   # register as surface with Ardour, capture
+    ./osc_capture.py 9100 --print                       # print live traffic
+    ./osc_capture.py --dump session.osclog              # print a log
+
+Log format: LOG_HEADER, then per datagram a RECORD_HEADER (monotonic
+timestamp in ns, length) followed by the raw datagram.
+"""
+
+import argparse
+import asyncio
+import logging
+import struct
+import sys
+import time
+
+from pythonosc.osc_packet import OscPacket, ParseError
+
+LOG_MAGIC = b'NIKOSC\0\0'
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct('<8sI')
+RECORD_HEADER = struct.Struct('<QI')
+
+
+def write_log_header(f):
+    f.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION))
+
+def read_log(path):
+    'Yields (monotonic ns, datagram) of a capture log'
+    with open(path, 'rb') as f:
+        magic, version = LOG_HEADER.unpack(f.read(LOG_HEADER.size))
+        if magic != LOG_MAGIC:
+            raise ValueError(f'{path} is not an OSC capture log')
+        if version != LOG_VERSION:
+            raise ValueError(f'{path}: unsupported log version {version}')
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            timestamp, length = RECORD_HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                logging.warning(f'{path}: truncated last record')
+                return
+            yield timestamp, data
+
+def format_datagram(data):
+    try:
+        packet = OscPacket(data)
+    except ParseError:
+        return [f'<unparsable, {len(data)} bytes>']
+    return [ f'{m.message.address}: {tuple(m.message.params)!r}' for m in packet.messages ]
+
+
+class CaptureProtocol(asyncio.DatagramProtocol):
+    def __init__(self, out=None, print_messages=False):
+        self.out = out
+        self.print_messages = print_messages
+        self.count = 0
+        self.bytes = 0
+
+    def datagram_received(self, data, address):
+        self.count += 1
+        self.bytes += len(data)
+        if self.out is not None:
+            self.out.write(RECORD_HEADER.pack(time.monotonic_ns(), len(data)))
+            self.out.write(data)
+        if self.print_messages:
+            for line in format_datagram(data):
+                sys.stdout.write(line + '\n')
+
+
+def send_surface_setup(transport, port, bank_size):
+    'Register with Ardour the way OscRemoteState does, so it sends feedback to us'
+    import osc_state
+    ors = osc_state.OscRemoteState(bank_size=bank_size)
+    ors.local_port = port
+    ors.client = osc_state.OscSender(transport, ('localhost', 3819))
+    ors._send_set_surface()
+    ors.client.send_message('/strip/list', None)
+
+
+async def capture(port, output=None, print_messages=False, surface=False, bank_size=0, status_interval=5.):
+    out = None
+    if output is not None:
+        # large buffer, written out in the background of the os
+        out = open(output, 'wb', buffering=1024*1024)
+        write_log_header(out)
+
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+            lambda: CaptureProtocol(out, print_messages), local_addr=('localhost', port))
+    if surface:
+        send_surface_setup(transport, port, bank_size)
+
+    try:
+        last_count = 0
+        while True:
+            await asyncio.sleep(status_interval)
+            if out is not None:
+                out.flush()
+            logging.info(f'{protocol.count} datagrams ({protocol.bytes} bytes), {(protocol.count - last_count) / status_interval:.0f}/s')
+            last_count = protocol.count
+    finally:
+        transport.close()
+        if out is not None:
+            out.close()
+
+
+def dump(path):
+    start = None
+    for timestamp, data in read_log(path):
+        if start is None:
+            start = timestamp
+        for line in format_datagram(data):
+            sys.stdout.write(f'{(timestamp - start) / 1e9:12.6f} {line}\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Capture OSC traffic to a binary log')
+    parser.add_argument('port', type=int, nargs='?', help='udp port to listen on')
+    parser.add_argument('-o', '--output', help='capture log to write')
+    parser.add_argument('--print', action='store_true', help='print received messages')
+    parser.add_argument('--surface', action='store_true', help='register with Ardour on localhost as an OSC surface')
+    parser.add_argument('--bank-size', type=int, default=0, help='bank size to register with --surface')
+    parser.add_argument('--dump', metavar='LOG', help='print a capture log and exit')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.dump:
+        dump(args.dump)
+        return
+    if args.port is None:
+        parser.error('port is required for capturing')
+    if not args.output and not args.print:
+        parser.error('nothing to do, give --output and/or --print')
+
+    try:
+        asyncio.run(capture(args.port, args.output, args.print, args.surface, args.bank_size))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
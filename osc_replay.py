@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Send an osc_capture.py log to a running nikontrol (or anything else), with
+the recorded timing, N times faster, or as fast as possible.
+
+    ./osc_replay.py session.osclog                # 1x to localhost:9100
+    ./osc_replay.py session.osclog --speed 4
+    ./osc_replay.py session.osclog --speed 0      # no delays
+"""
+
+import argparse
+import logging
+import socket
+import time
+
+import osc_capture
+
+
+def replay(path, address, speed=1., loop=1):
+    records = list(osc_capture.read_log(path))
+    if not records:
+        logging.warning(f'{path}: no datagrams')
+        return
+    # resolve once, sendto with a host name would do a (blocking) lookup every time
+    family, type, proto, _, address = socket.getaddrinfo(*address, type=socket.SOCK_DGRAM)[0]
+    sock = socket.socket(family, type, proto)
+    first = records[0][0]
+    sent = 0
+    start = time.perf_counter()
+    for _ in range(loop):
+        run_start = time.perf_counter()
+        for timestamp, data in records:
+            if speed:
+                delay = run_start + (timestamp - first) / 1e9 / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            sock.sendto(data, address)
+            sent += 1
+    elapsed = time.perf_counter() - start
+    sock.close()
+    logging.info(f'sent {sent} datagrams in {elapsed:.2f}s ({sent / elapsed:.0f}/s)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay an OSC capture log')
+    parser.add_argument('log', help='capture log written by osc_capture.py')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9100, help='nikontrol\'s OSC port')
+    parser.add_argument('--speed', type=float, default=1., help='speed factor, 0 for as fast as possible')
+    parser.add_argument('--loop', type=int, default=1, help='number of times to send the log')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        replay(args.log, (args.host, args.port), args.speed, args.loop)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
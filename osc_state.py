@@ -1,29 +1,197 @@
+import array
 import asyncio
 import enum
+import json
 import logging
+import math
+import os
 import re
+import socket
+import struct
+import time
+
+import meters
+import util
 from pythonosc.osc_server import AsyncIOOSCUDPServer
-from pythonosc.udp_client import SimpleUDPClient
 from pythonosc.dispatcher import Dispatcher
+from pythonosc.osc_bundle_builder import OscBundleBuilder, IMMEDIATELY
 from pythonosc.osc_message_builder import OscMessageBuilder
 
-# packet loss with default kernel network buffer size (212992)
-# works better with increased buffer size:
+# packet loss with default kernel network buffer size (212992), the server
+# socket asks for recv_buffer_size itself. The kernel caps that at
+# net.core.rmem_max unless running with CAP_NET_ADMIN, raise it if warned:
 # sysctl -w net.core.rmem_max=26214400
-# sysctl -w net.core.rmem_default=26214400
 
-# monkey patch osc server to give close event
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'nikontrol', 'ardour_state.json')
+
+# meter feedback is most of the traffic, these datagrams are recognized by
+# their padded address and type tag and decoded without python-osc
+_STRIP_METER_PREFIX = b'/strip/meter\0\0\0\0,if\0'
+_STRIP_METER = struct.Struct('>if')
+_MASTER_METER_PREFIX = b'/master/meter\0\0\0,f\0\0'
+_MASTER_METER = struct.Struct('>f')
+
+# monkey patch osc server to give close event and the meter fast path
 class _OSCProtocolFactory(AsyncIOOSCUDPServer._OSCProtocolFactory):
+
+    # datagrams read directly from the socket after one received through the
+    # event loop, so a meter burst is handled in one loop iteration
+    DRAIN_LIMIT = 64
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.close_event = asyncio.Event()
+        # callable(ssid, value) for meter datagrams, None to use the dispatcher for everything
+        self.meter_sink = None
+        self._sock = None
+
+    def connection_made(self, transport):
+        super().connection_made(transport)
+        # the transport only exposes a restricted socket wrapper, receive on
+        # a duplicate of the (non-blocking) socket instead
+        tsock = transport.get_extra_info('socket')
+        self._sock = socket.socket(tsock.family, tsock.type, tsock.proto, fileno=os.dup(tsock.fileno()))
+        self._sock.setblocking(False)
 
     def connection_lost(self, exc):
         super().connection_lost(exc)
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
         self.close_event.set()
+
+    def datagram_received(self, data, client_address):
+        self._handle_datagram(data, client_address)
+        if self.meter_sink is None or self._sock is None:
+            return
+        for _ in range(self.DRAIN_LIMIT):
+            try:
+                data, client_address = self._sock.recvfrom(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                self.error_received(e)
+                return
+            self._handle_datagram(data, client_address)
+
+    def set_profiler(self, profiler):
+        """
+        Time every datagram into profiler.record(address, size, seconds), None
+        to stop. Swaps in a wrapper, the plain path has no profiling checks.
+        """
+        if profiler is None:
+            self.__dict__.pop('_handle_datagram', None)
+            return
+
+        # the unwrapped method, also when replacing an earlier profiler
+        handle_datagram = type(self)._handle_datagram.__get__(self)
+        perf_counter = time.perf_counter
+        record = profiler.record
+        def profiled_handle_datagram(data, client_address):
+            start = perf_counter()
+            handle_datagram(data, client_address)
+            # address up to its padding, '#bundle' for bundles
+            record(data[:data.find(b'\0')], len(data), perf_counter() - start)
+        self._handle_datagram = profiled_handle_datagram
+
+    def _handle_datagram(self, data, client_address):
+        sink = self.meter_sink
+        if sink is not None:
+            size = len(data)
+            if size == 28 and data.startswith(_STRIP_METER_PREFIX):
+                sink(*_STRIP_METER.unpack_from(data, 20))
+                return
+            if size == 24 and data.startswith(_MASTER_METER_PREFIX):
+                sink('master', *_MASTER_METER.unpack_from(data, 20))
+                return
+        super().datagram_received(data, client_address)
 AsyncIOOSCUDPServer._OSCProtocolFactory = _OSCProtocolFactory
 
 
+class OscSender():
+    """
+    Non-blocking replacement for SimpleUDPClient, sends over the OSC server's
+    datagram transport (so from the reply port, no extra socket). Messages
+    queued during one loop iteration are packed into OSC bundles.
+    """
+
+    def __init__(self, transport, address, max_datagram_size=4096):
+        self.transport = transport
+        self.max_datagram_size = max_datagram_size
+
+        # resolve once, sendto with a host name would do a (blocking) lookup every time
+        sock = transport.get_extra_info('socket')
+        self.address = socket.getaddrinfo(*address, family=sock.family, type=socket.SOCK_DGRAM)[0][4]
+
+        self._queue = []
+        self._flush_handle = None
+
+        self.start_time = time.monotonic()
+        self.messages_sent = 0
+        self.datagrams_sent = 0
+        self.bundles_sent = 0
+        self.bytes_sent = 0
+
+    def send_message(self, address, value):
+        'Same signature as SimpleUDPClient.send_message'
+        builder = OscMessageBuilder(address)
+        if value is None:
+            values = []
+        elif isinstance(value, (list, tuple)):
+            values = value
+        else:
+            values = [value]
+        for v in values:
+            builder.add_arg(v)
+        self._queue.append(builder.build())
+
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_soon(self.flush)
+
+    def flush(self):
+        self._flush_handle = None
+        queue, self._queue = self._queue, []
+        self.messages_sent += len(queue)
+
+        # group into bundles that stay below the datagram size limit
+        chunk = []
+        chunk_size = 16 # '#bundle\0' + time tag
+        for msg in queue:
+            if chunk and chunk_size + 4 + msg.size > self.max_datagram_size:
+                self._send_chunk(chunk)
+                chunk = []
+                chunk_size = 16
+            chunk.append(msg)
+            chunk_size += 4 + msg.size
+        if chunk:
+            self._send_chunk(chunk)
+
+    def _send_chunk(self, messages):
+        if len(messages) == 1:
+            dgram = messages[0].dgram
+        else:
+            builder = OscBundleBuilder(IMMEDIATELY)
+            for msg in messages:
+                builder.add_content(msg)
+            dgram = builder.build().dgram
+            self.bundles_sent += 1
+
+        self.transport.sendto(dgram, self.address)
+        self.datagrams_sent += 1
+        self.bytes_sent += len(dgram)
+
+    def get_stats(self):
+        elapsed = max(time.monotonic() - self.start_time, 1e-9)
+        return {
+                'messages': self.messages_sent,
+                'datagrams': self.datagrams_sent,
+                'bundles': self.bundles_sent,
+                'bytes': self.bytes_sent,
+                'messages_per_second': self.messages_sent / elapsed,
+                'datagrams_per_second': self.datagrams_sent / elapsed,
+            }
+
+
 LOG_UNKNOWN_MESSAGES = False
 LOG_STATE_CHANGES = True
 
@@ -32,6 +200,25 @@ class OscEventType(enum.Enum):
     STRIP_LIST = enum.auto()
     STRIP_DATA = enum.auto()
 
+class StripListChanges():
+    """
+    Argument of OscEventType.STRIP_LIST, ssids of the strips that were added,
+    removed, renamed (new route at that position) or reordered (route that
+    was at another position before).
+    """
+
+    def __init__(self):
+        self.added = set()
+        self.removed = set()
+        self.renamed = set()
+        self.reordered = set()
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.renamed or self.reordered)
+
+    def __repr__(self):
+        return f'StripListChanges(added={self.added}, removed={self.removed}, renamed={self.renamed}, reordered={self.reordered})'
+
 class ArdourOscStripFlags(enum.IntFlag):
     NONE = 0
     AUDIO_TRACKS = 1
@@ -84,54 +271,296 @@ def dispatch(address=None):
         return func
     return f
 
+def get_dispatch_table(cls):
+    """
+    Address -> member name of all @dispatch decorated members of cls. Built
+    once per class and shared by all instances.
+    """
+    table = cls.__dict__.get('_dispatch_table')
+    if table is None:
+        table = {}
+        for member_name in dir(cls):
+            member = getattr(cls, member_name)
+            for address in getattr(member, '_dispatch_to', ()):
+                table[address] = member_name
+        cls._dispatch_table = table
+    return table
+
 def log_osc_message(address, *args):
     logging.debug(f'{address}: {args!r}')
 
 class OscRemoteState():
-    def __init__(self):
+
+    # global state messages, address -> (state key, type converter)
+    STATE_ROUTES = {
+            '/session_name': ('session_name', str),
+            '/rec_enable_toggle': ('rec_enabled', bool),
+            '/transport_stop': ('transport_stopped', bool),
+            '/transport_play': ('transport_playing', bool),
+            '/ffwd': ('ffwd', bool),
+            '/rewind': ('rewind', bool),
+            '/loop_toggle': ('loopmode_enabled', bool),
+            '/cancel_all_solos': ('solo_active', bool),
+            '/record_tally': ('any_record_active', bool),
+            '/toggle_click': ('click_active', bool),
+            '/click/level': ('click_level', float),
+            '/position/smpte': ('playhead_position', str),
+            # '/position/bbt': ('playhead_position', str),
+            # '/position/time': ('playhead_position', str),
+            # '/position/samples': ('playhead_position', str),
+        }
+
+    # Ardour sends a heartbeat every second
+    HEARTBEAT_INTERVAL = 1.
+    # seconds between checks for lost packets, and minimum time between resyncs
+    LOSS_CHECK_INTERVAL = 1.
+    RESYNC_INTERVAL = 2.
+    # values a /strip/list entry carries
+    STRIP_LIST_KEYS = ('strip_type', 'name', 'ninputs', 'noutputs', 'muted', 'soloed', 'ssid', 'recenabled')
+
+    # wait between the handshake and the first /strip/list
+    STRIP_LIST_SETTLE_DELAY = .1
+    # a strip list refresh may take handshake_timeout plus this per strip
+    REFRESH_TIMEOUT_PER_STRIP = .002
+
+    def __init__(self, bank_size=0, notify_delay=.002, handshake_timeout=.5, handshake_retries=None, recv_buffer_size=4*1024*1024, meter_rate=30, snapshot_path=None):
         self.strips = {}
+        self.strip_store = StripStore()
         self.state = {}
         self.changed_callbacks = []
         self.refreshing_strip_list = False
+        self._refresh_seen = set()
+        self._refresh_names = {}
+        self._refresh_lost = False
 
-    def _get_dispatcher(self):
-        state_dict = {
-                '/session_name': ('session_name', str),
-                '/rec_enable_toggle': ('rec_enabled', bool),
-                '/transport_stop': ('transport_stopped', bool),
-                '/transport_play': ('transport_playing', bool),
-                '/ffwd': ('ffwd', bool),
-                '/rewind': ('rewind', bool),
-                '/loop_toggle': ('loopmode_enabled', bool),
-                '/cancel_all_solos': ('solo_active', bool),
-                '/record_tally': ('any_record_active', bool),
-                '/toggle_click': ('click_active', bool),
-                '/click/level': ('click_level', float),
-                '/position/smpte': ('playhead_position', str),
-                # '/position/bbt': ('playhead_position', str),
-                # '/position/time': ('playhead_position', str),
-                # '/position/samples': ('playhead_position', str),
+        # changes are collected and delivered to the callbacks at once, at
+        # most notify_delay seconds later (0: at the end of the loop iteration)
+        self.notify_delay = notify_delay
+        self._strip_list_changes = StripListChanges()
+        self._changed_strips = set()
+        self._changed_keys = set()
+        self._notify_handle = None
+
+        # with banking Ardour only sends feedback for the bank_size strips
+        # starting at bank_start, using surface relative ssids (1..bank_size).
+        # Strips are kept under their absolute ssid here.
+        self.bank_size = bank_size
+        self.bank_start = 1
+        self._reply_index = 0
+        self._refresh_bank_start = 1 # bank start the running strip list starts at
+        self._refresh_positional = False # entries past the bank, numbered by position
+        self._refresh_drops = None
+        self._refresh_order = []
+        self._last_refresh_order = None
+        self._bank_fence = None # timer while feedback for the old bank may still arrive
+        # strips below this ssid were listed before Ardour's last route change
+        # (the list only starts at the bank), None if all are up to date
+        self._stale_below = None
+
+        self.client = None
+        self.protocol = None
+        self.local_port = 9100
+        self.traffic_profiler = None
+
+        # handshake: /set_surface is answered with the session name, then the
+        # strip list is requested. ready is set once both are done.
+        self.handshake_timeout = handshake_timeout
+        self.handshake_retries = handshake_retries
+        self.session_ready = asyncio.Event()
+        self.strip_list_done = asyncio.Event()
+        self.ready = asyncio.Event()
+
+        # loss detection, anything lost triggers a resync (strip list refresh)
+        self.recv_buffer_size = recv_buffer_size
+        self.loss_stats = {
+                'heartbeat_gaps': 0,
+                'socket_drops': 0,
+                'refresh_gaps': 0,
+                'refresh_timeouts': 0,
+                'resyncs': 0,
+                'bank_fence_timeouts': 0,
             }
+        self._last_heartbeat = None
+        self._socket_drops = None
+        self._refresh_start = None
+        self._last_reply = None
+        self._refresh_pending = False # another refresh asked for while one is running
+        self._last_resync = None
+        self._resync_handle = None
+
+        # meter values are published at meter_rate, 0 to notify each raw value
+        self.meters = meters.MeterProcessor(self, rate=meter_rate) if meter_rate else None
+
+        # last known state for a warm start, saved on change
+        self.snapshot_path = snapshot_path
+        self._snapshot_trigger = util.AsyncTrigger(1., 5., self.save_snapshot) if snapshot_path else None
+        self._snapshot_saved = None
+        self._snapshot_session = None # session name of a loaded snapshot, until Ardour answers
+
+    def _get_dispatcher(self):
         dispatcher = Dispatcher()
-        for member_name in dir(self.__class__):
-            member = getattr(self.__class__, member_name)
-            if hasattr(member, '_dispatch_to'):
-                for address in member._dispatch_to:
-                    dispatcher.map(address, getattr(self, member_name))
-        for address, (target_name, target_type) in state_dict.items():
+        for address, member_name in get_dispatch_table(self.__class__).items():
+            dispatcher.map(address, getattr(self, member_name))
+        for address, (target_name, target_type) in self.STATE_ROUTES.items():
             dispatcher.map(address, self.on_state, target_name, target_type)
         if LOG_UNKNOWN_MESSAGES:
             dispatcher.set_default_handler(log_osc_message)
         return dispatcher
 
     async def start_server(self):
-        local_port = 9100
-        self.client = SimpleUDPClient('localhost', 3819)
-        self.server = AsyncIOOSCUDPServer(('localhost', local_port), self._get_dispatcher(), asyncio.get_event_loop())
+        self.server = AsyncIOOSCUDPServer(('localhost', self.local_port), self._get_dispatcher(), asyncio.get_event_loop())
         self.transport, self.protocol = await self.server.create_serve_endpoint()
+        self.protocol.meter_sink = self.on_meter
+        self.protocol.set_profiler(self.traffic_profiler)
+        self._set_recv_buffer()
+        self.client = OscSender(self.transport, ('localhost', 3819))
+
+        await self._retry('/set_surface', self._send_set_surface, self.session_ready)
+        # Ardour may answer a /strip/list right after /set_surface with a
+        # short or empty list (that still ends with end_route_list)
+        await asyncio.sleep(self.STRIP_LIST_SETTLE_DELAY)
+        expected = self.get_strip_count() # from the snapshot, if any
+        logging.info('doing initial refresh')
+        await self._retry('/strip/list', self._send_strip_list, self.strip_list_done)
+        count = self.get_strip_count()
+        if not count or count < expected:
+            logging.info(f'initial strip list has {count} strips (expected {expected}), requesting it again')
+            await self._retry('/strip/list', self._send_strip_list, self.strip_list_done)
+        self.ready.set()
+
+        # as per https://stackoverflow.com/a/65688291
+        # await asyncio.Event().wait()
+
+        watch_task = asyncio.create_task(self._watch_loss())
+        if self.meters is not None:
+            self.meters.start()
+        try:
+            await self.protocol.close_event.wait()
+        finally:
+            watch_task.cancel()
+            if self.meters is not None:
+                self.meters.stop()
+            if self.snapshot_path:
+                self.save_snapshot()
+
+    def set_traffic_profiler(self, profiler):
+        """
+        Record per address counts, bytes and handling time of the received
+        traffic (including the StripState handlers) in a
+        profiling.OscTrafficProfiler, None to stop.
+        """
+        self.traffic_profiler = profiler
+        if self.protocol is not None:
+            self.protocol.set_profiler(profiler)
+
+    def _set_recv_buffer(self):
+        if not self.recv_buffer_size:
+            return
+        sock = self.transport.get_extra_info('socket')
+        try:
+            # not capped by rmem_max, needs CAP_NET_ADMIN
+            sock.setsockopt(socket.SOL_SOCKET, getattr(socket, 'SO_RCVBUFFORCE', socket.SO_RCVBUF), self.recv_buffer_size)
+        except OSError:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer_size)
+        # linux reports twice the usable size
+        size = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if size < self.recv_buffer_size:
+            logging.warning(f'receive buffer capped at {size} bytes (asked for {self.recv_buffer_size}), raise net.core.rmem_max')
+        else:
+            logging.info(f'receive buffer size {size} bytes')
+
+    def _read_socket_drops(self):
+        """
+        Drop counter of the server socket from /proc/net/udp(6), None if not
+        available (not on linux).
+        """
+        try:
+            inode = str(os.fstat(self.transport.get_extra_info('socket').fileno()).st_ino)
+        except (OSError, AttributeError):
+            return None
+        for path in ('/proc/net/udp', '/proc/net/udp6'):
+            try:
+                with open(path) as f:
+                    next(f) # header
+                    for line in f:
+                        fields = line.split()
+                        # ... uid timeout inode ref pointer drops
+                        if fields[9] == inode:
+                            return int(fields[-1])
+            except (OSError, IndexError, ValueError):
+                continue
+        return None
+
+    async def _watch_loss(self):
+        loop = asyncio.get_running_loop()
+        self._socket_drops = self._read_socket_drops()
+        while True:
+            await asyncio.sleep(self.LOSS_CHECK_INTERVAL)
+            reason = None
+
+            drops = self._read_socket_drops()
+            if drops is not None and self._socket_drops is not None and drops > self._socket_drops:
+                self.loss_stats['socket_drops'] += drops - self._socket_drops
+                reason = f'{drops - self._socket_drops} datagrams dropped by the socket'
+            self._socket_drops = drops
+
+            # the end_route_list reply got lost, the refresh would never finish
+            if self.refreshing_strip_list and self._refresh_stalled(loop.time(), self.get_refresh_timeout()):
+                self.loss_stats['refresh_timeouts'] += 1
+                reason = 'strip list refresh not finished'
+
+            if reason is not None:
+                self.resync(reason)
+
+    def resync(self, reason):
+        """
+        Refresh the strip list after lost packets. Meter values are cleared
+        instead of showing stale levels until Ardour sends the next ones.
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._last_resync is not None and now - self._last_resync < self.RESYNC_INTERVAL:
+            logging.info(f'packet loss ({reason}), resync pending')
+            if self._resync_handle is None:
+                self._resync_handle = loop.call_at(self._last_resync + self.RESYNC_INTERVAL, self.resync, reason)
+            return
+        if self._resync_handle is not None:
+            self._resync_handle.cancel()
+            self._resync_handle = None
+        self._last_resync = now
+        self.loss_stats['resyncs'] += 1
+        logging.warning(f'packet loss ({reason}), resyncing')
+
+        for strip in self.strips.values():
+            if strip.get('meter') is not None:
+                strip.set('meter', math.nan) # unset
+                self.on_strip_changed(strip)
+        if self.meters is not None:
+            self.meters.reset()
+        if self.client is not None:
+            self._send_strip_list()
+
+    async def _retry(self, name, send, event):
+        """
+        Send a request until Ardour's answer sets the event. Waits
+        handshake_timeout per attempt, up to handshake_retries attempts (None
+        retries forever, eg. while Ardour isn't running yet).
+        """
+        attempt = 0
+        while True:
+            send()
+            try:
+                await asyncio.wait_for(event.wait(), self.handshake_timeout)
+                return
+            except asyncio.TimeoutError:
+                attempt += 1
+                if self.handshake_retries is not None and attempt >= self.handshake_retries:
+                    raise ConnectionError(f'no answer from Ardour to {name}')
+                logging.warning(f'no answer from Ardour to {name}, retrying (attempt {attempt})')
 
+    def _send_set_surface(self):
         self.client.send_message('/set_surface', (
-                0, # no banking
+                self.bank_size, # 0: no banking
 
                 # strips
                 ArdourOscStripFlags.AUDIO_TRACKS |
@@ -160,72 +589,250 @@ class OscRemoteState():
                 ArdourOscGainMode.FADER_AND_GAIN,
                 0, # no send paging
                 0, # no plugin paging
-                local_port, # reply port
+                self.local_port, # reply port
             ))
-
-        while self.get('session_name', None) is None:
-            await asyncio.sleep(.1)
-            print('WAITING')
-        await asyncio.sleep(.1) # initial /strip/list is unreliable without this sleep
-        logging.info('doing initial refresh')
-        self._send_strip_list()
-
-        # as per https://stackoverflow.com/a/65688291
-        # await asyncio.Event().wait()
-
-        await self.protocol.close_event.wait()
+        if self.bank_size and self.bank_start != 1:
+            self.client.send_message('/set_bank', self.bank_start)
 
     def get_drawable_strips(self):
-        res = []
-
-        # TODO maybe change logic and check for refreshing state everywhere else, and refresh into temporary dict
-        using_dict = self.old_strips if self.refreshing_strip_list else self.strips
-
         # XXX
-        # if (strip := using_dict.get('master')) is not None:
+        # if (strip := self.strips.get('master')) is not None:
         #     res.append(strip)
-        for strip in using_dict.values():
-            try:
-                i = int(strip.ssid)
-            except:
-                pass
-            else:
-                res.append(strip)
-        return res
+        # strips are updated in place during a refresh, always consistent
+        return [ self.strips[ssid] for ssid in sorted(ssid for ssid in self.strips if isinstance(ssid, int)) ]
 
 
     @dispatch()
     def on_heartbeat(self, address, *args):
         # logging.debug(f'heartbeat')
-        pass
+        now = time.monotonic()
+        if self._last_heartbeat is not None and now - self._last_heartbeat > 1.5 * self.HEARTBEAT_INTERVAL:
+            missed = round((now - self._last_heartbeat) / self.HEARTBEAT_INTERVAL) - 1
+            self.loss_stats['heartbeat_gaps'] += 1
+            self.resync(f'{missed} heartbeat(s) missed')
+        self._last_heartbeat = now
 
     @dispatch('/strip/list')
     def on_strip_list(self, address):
         logging.info('DOING REFRESH')
+        if self.bank_size and self.bank_start > 1:
+            self._stale_below = max(self._stale_below or 0, self.bank_start)
         self._send_strip_list()
 
+    def get_strip_count(self):
+        return sum(1 for ssid in self.strips if isinstance(ssid, int))
+
+    def clamp_bank_start(self, first_ssid):
+        'Bank start Ardour uses for the requested one, the last bank is moved down to stay full'
+        nstrips = self.get_strip_count()
+        if nstrips and nstrips <= self.bank_size:
+            return 1
+        if nstrips and first_ssid > nstrips - self.bank_size + 1:
+            first_ssid = nstrips - self.bank_size + 1
+        return max(first_ssid, 1)
+
+    def set_bank(self, first_ssid):
+        """
+        Subscribe to feedback for the bank starting at the given (absolute,
+        1-based) ssid. Returns the bank start actually used, see
+        clamp_bank_start.
+        """
+        if not self.bank_size:
+            return 1
+        first_ssid = self.clamp_bank_start(first_ssid)
+        if first_ssid == self.bank_start:
+            return first_ssid
+        logging.info(f'switching to bank at strip {first_ssid}')
+        self.bank_start = first_ssid
+        if self.client is not None: # otherwise sent when connecting
+            self._fence_bank_feedback()
+            self.client.send_message('/set_bank', first_ssid)
+            if self._stale_below is not None and first_ssid < self._stale_below:
+                # the list now starts at the new bank (handled after /set_bank)
+                logging.info(f'strips below {self._stale_below} changed while outside of the bank, refreshing')
+                self._send_strip_list()
+        return first_ssid
+
+    def _fence_bank_feedback(self):
+        """
+        Feedback Ardour sent for the old bank may still be on its way, its
+        ssids would be taken as relative to the new bank. Strip feedback is
+        dropped until Ardour answers a query sent right before /set_bank (in
+        the same bundle, so handled just before it), at most
+        handshake_timeout.
+        """
+        if self._bank_fence is not None:
+            self._bank_fence.cancel()
+        self._bank_fence = asyncio.get_running_loop().call_later(self.handshake_timeout, self._on_bank_fence_timeout)
+        self.client.send_message('/transport_speed', None)
+
+    def _end_bank_fence(self):
+        if self._bank_fence is not None:
+            self._bank_fence.cancel()
+            self._bank_fence = None
+
+    def _on_bank_fence_timeout(self):
+        # The answer got lost, and with it probably the new bank's feedback
+        # that was dropped meanwhile. Nothing of the old bank is in flight
+        # anymore, so ask for the bank again without a fence.
+        self._bank_fence = None
+        self.loss_stats['bank_fence_timeouts'] += 1
+        logging.warning(f'no answer after switching banks, requesting bank at strip {self.bank_start} again')
+        if self.client is not None:
+            self.client.send_message('/set_bank', self.bank_start)
+
+    @dispatch()
+    def on_transport_speed(self, address, *args):
+        # answer to the query of _fence_bank_feedback
+        self._end_bank_fence()
+
+    def to_absolute_ssid(self, ssid):
+        if self.bank_size and isinstance(ssid, int):
+            return ssid + self.bank_start - 1
+        return ssid
+
+    def to_surface_ssid(self, ssid):
+        'Ssid to use in commands sent to Ardour, None if the strip is not in the current bank'
+        if not self.bank_size or not isinstance(ssid, int):
+            return ssid
+        if not self.bank_start <= ssid < self.bank_start + self.bank_size:
+            return None
+        return ssid - self.bank_start + 1
+
+    def get_refresh_timeout(self):
+        return self.handshake_timeout + self.REFRESH_TIMEOUT_PER_STRIP * self.get_strip_count()
+
+    def _refresh_stalled(self, now, timeout):
+        'The running refresh took longer than timeout, and no /reply arrived for handshake_timeout'
+        last_reply = self._last_reply if self._last_reply is not None else self._refresh_start
+        return now - self._refresh_start >= timeout and now - last_reply >= self.handshake_timeout
+
     def _send_strip_list(self):
+        # Replies don't tell which request they answer. While a refresh is
+        # running another one is only sent after it, unless it stalled (its
+        # remaining replies are taken as lost then).
+        now = asyncio.get_running_loop().time()
+        if self.refreshing_strip_list and not self._refresh_stalled(now, self.handshake_timeout):
+            self._refresh_pending = True
+            return
+        self._refresh_pending = False
+
+        # the existing StripState objects are kept and updated in place, the
+        # differences are reported once end_route_list arrives
         self.refreshing_strip_list = True
-        self.old_strips = self.strips
-        self.strips = {}
-        if 'master' in self.old_strips: # might not be present, eg when initializing
-            self.strips['master'] = self.old_strips['master']
+        self.strip_list_done.clear()
+        self._refresh_start = now
+        self._last_reply = None
+        self._reply_index = 0
+        self._refresh_lost = False
+        self._refresh_seen = set()
+        self._refresh_names = { ssid: strip.get('name') for ssid, strip in self.strips.items() }
+        self._refresh_bank_start = self.bank_start
+        self._refresh_positional = False
+        self._refresh_order = []
+        self._refresh_drops = self._read_socket_drops()
 
         # self.trigger_changed_callback(None) # XXX
         self.client.send_message('/strip/list', None)
 
+    def _verify_strip_list(self):
+        """
+        With banking, entries past the bank come with ssid 0 and are numbered
+        by position, a lost one would shift all following strips. As they
+        can't be checked one by one, the list is trusted if the socket didn't
+        drop anything during the refresh, or without a drop counter, once two
+        refreshes in a row agree.
+        """
+        order, self._refresh_order = self._refresh_order, []
+        if not self._refresh_positional:
+            return True
+        drops = self._read_socket_drops()
+        if drops is not None and self._refresh_drops is not None:
+            return drops == self._refresh_drops
+        verified = order == self._last_refresh_order
+        self._last_refresh_order = order
+        return verified
+
+    def _remove_strip(self, ssid):
+        # the store row gets reused, handles still held elsewhere (drawers,
+        # fader targets) are invalidated
+        strip = self.strips.pop(ssid)
+        self.strip_store.remove(ssid)
+        strip.row = None
+
+    def _finish_strip_list(self):
+        changes = StripListChanges()
+
+        # with banking, the list only starts at the current bank, keep the strips before
+        for ssid in list(self.strips):
+            if isinstance(ssid, int) and ssid >= self._refresh_bank_start and ssid not in self._refresh_seen:
+                self._remove_strip(ssid)
+                changes.removed.add(ssid)
+
+        old_names = { name: ssid for ssid, name in self._refresh_names.items() }
+        for ssid in self._refresh_seen:
+            if ssid not in self._refresh_names:
+                changes.added.add(ssid)
+                continue
+            name = self.strips[ssid].get('name')
+            if name == self._refresh_names[ssid]:
+                continue
+            if name in old_names:
+                changes.reordered.add(ssid)
+            else:
+                changes.renamed.add(ssid)
+
+        self.refreshing_strip_list = False
+        self._refresh_names = {}
+        if self._stale_below is not None and self._refresh_bank_start < self._stale_below:
+            self._stale_below = self._refresh_bank_start if self._refresh_bank_start > 1 else None
+
+        # Ardour clamps the bank again when strips are removed
+        bank_start = self.clamp_bank_start(self.bank_start) if self.bank_size else 1
+        if bank_start != self.bank_start:
+            logging.info(f'bank moved to strip {bank_start}')
+            self.bank_start = bank_start
+
+        # The ssid now holds another route, everything not in its list entry
+        # is still the previous route's. Ardour's feedback for them may have
+        # arrived before the list, so the bank's is requested again.
+        moved = changes.renamed | changes.reordered
+        for ssid in moved:
+            self.strips[ssid].clear(keep=self.STRIP_LIST_KEYS)
+            if self.meters is not None:
+                self.meters.forget(ssid)
+        if self.client is not None and any(self.to_surface_ssid(ssid) is not None for ssid in moved):
+            self.client.send_message('/set_bank', self.bank_start)
+
+        if changes:
+            logging.info(f'strip list changed: {changes}')
+            self.on_strip_list_changed(changes)
+            self.on_snapshot_changed()
+
     @dispatch('/reply')
     def on_reply(self, address, *args):
+        if not self.refreshing_strip_list:
+            # late answer to a request that was taken as lost
+            logging.info(f'ignoring strip list reply outside of a refresh: {args!r}')
+            return
+        self._last_reply = asyncio.get_running_loop().time()
+
         if args[0] == 'end_route_list':
             _, sample_rate, current_end_sample, monitor = args
             # TODO consolidate with dispatcher dict
-            self.state['sample_rate'] = int(sample_rate)
-            self.state['current_end_sample'] = int(current_end_sample)
-            self.state['monitored'] = bool(monitor)
-            self.refreshing_strip_list = False
-            self.trigger_changed_callback(OscEventType.STRIP_LIST)
-            self.trigger_changed_callback(OscEventType.GENERAL_DATA)
+            self.on_state(address, ('sample_rate', int), sample_rate)
+            self.on_state(address, ('current_end_sample', int), current_end_sample)
+            self.on_state(address, ('monitored', bool), monitor)
+            verified = self._verify_strip_list()
+            self._finish_strip_list()
+            self.strip_list_done.set()
             logging.info('refresh done')
+            if self._refresh_lost:
+                self.resync('strip list entries missing')
+            elif not verified:
+                self.resync('strip list not verifiable')
+            elif self._refresh_pending:
+                self._send_strip_list()
 
         else:
             if len(args) == 8:
@@ -238,23 +845,41 @@ class OscRemoteState():
             else:
                 raise ValueError()
 
+            # entries come in ssid order, a skipped one was lost. With banking
+            # the ssid is bank relative, and 0 outside the bank.
+            if ssid and ssid != self._reply_index + 1 and not self._refresh_lost:
+                self.loss_stats['refresh_gaps'] += 1
+                self._refresh_lost = True
+
+            if self.bank_size:
+                # the given ssid is bank relative (0 outside the bank), the list starts at the bank
+                if not ssid:
+                    self._refresh_positional = True
+                ssid = self._refresh_bank_start + self._reply_index
+            self._reply_index += 1
+            self._refresh_order.append(name)
+
             logging.info(f'refresh entry {ssid} {name}')
 
             if not ssid in self.strips:
                 self.strips[ssid] = StripState(self, ssid)
 
             strip = self.strips[ssid]
+            self._refresh_seen.add(ssid)
 
             # TODO consolidate with dispatcher dict
-            strip.state['strip_type'] = str(strip_type)
-            strip.state['name'] = str(name)
-            strip.state['ninputs'] = int(ninputs)
-            strip.state['noutputs'] = int(noutputs)
-            strip.state['muted'] = bool(muted)
-            strip.state['soloed'] = bool(soloed)
-            strip.state['ssid'] = ssid
+            changed = strip.set('strip_type', str(strip_type))
+            changed |= strip.set('name', str(name))
+            changed |= strip.set('ninputs', int(ninputs))
+            changed |= strip.set('noutputs', int(noutputs))
+            changed |= strip.set('muted', bool(muted))
+            changed |= strip.set('soloed', bool(soloed))
+            changed |= strip.set('ssid', ssid)
             if not bus:
-                strip.state['recenabled'] = bool(rec_enabled)
+                changed |= strip.set('recenabled', bool(rec_enabled))
+            if changed:
+                self.on_strip_changed(strip)
+                self.on_snapshot_changed()
 
     @dispatch('/select/*')
     def on_select_message(self, address, *args):
@@ -269,33 +894,195 @@ class OscRemoteState():
 
         if ssid is None:
             return # '/strip/list' for example
+        if self._bank_fence is not None and ssid != 'master':
+            return # for the old bank
 
-        # kind of a hack, build a new message with reduced address to dispatch to strip class handler
-        # using a dispatcher directly is more complicated because of lacking API
-        empty, first_part, rest = address.split(sep='/', maxsplit=2)
-        assert empty == ''
-        omb = OscMessageBuilder('/' + rest)
-        for a in args:
-            omb.add_arg(a)
-        osc_msg = omb.build()
+        # strip address without the '/strip' or '/master' part
+        sub_address = address[address.index('/', 1):]
+        ssid = self.to_absolute_ssid(ssid)
 
         if not ssid in self.strips:
             self.strips[ssid] = StripState(self, ssid)
             if not self.refreshing_strip_list:
-                self.trigger_changed_callback(OscEventType.STRIP_LIST)
+                changes = StripListChanges()
+                changes.added.add(ssid)
+                self.on_strip_list_changed(changes)
+
+        self.strips[ssid].on_message(sub_address, *args)
 
-        self.strips[ssid].dispatcher.call_handlers_for_packet(osc_msg._dgram, None)
+    def on_meter(self, ssid, value):
+        'Meter datagrams decoded by the protocol, bypassing the dispatcher'
+        if self._bank_fence is not None and ssid != 'master':
+            return # for the old bank
+        strip = self.strips.get(self.to_absolute_ssid(ssid))
+        if strip is None:
+            # unknown strip, take the regular path to create it
+            if ssid == 'master':
+                self.on_strip_message('/master/meter', ssid, value)
+            else:
+                self.on_strip_message('/strip/meter', ssid, value)
+            return
+        strip.on_meter('/meter', value)
 
     def on_state(self, address, fixed_args, value):
         target_name, target_type = fixed_args
-        self.state[target_name] = target_type(value)
-        # setattr(self, target_name, target_type(value))
+        value = target_type(value)
+        if target_name == 'session_name':
+            # also when unchanged, the name may come from the snapshot
+            self._check_snapshot_session(value)
+            self.session_ready.set()
+        if target_name in self.state and self.state[target_name] == value:
+            return
+        self.state[target_name] = value
+        # setattr(self, target_name, value)
+        self.on_general_changed(target_name)
+        if target_name == 'session_name':
+            self.on_snapshot_changed()
         if LOG_STATE_CHANGES:
-            logging.debug(f'################# {target_name} = {target_type(value)!r}')
+            logging.debug(f'################# {target_name} = {value!r}')
+
+
+    def on_strip_list_changed(self, changes):
+        pending = self._strip_list_changes
+        pending.added |= changes.added
+        pending.removed |= changes.removed
+        pending.renamed |= changes.renamed
+        pending.reordered |= changes.reordered
+        self._schedule_notify()
 
+    def on_general_changed(self, *keys):
+        self._changed_keys.update(keys)
+        self._schedule_notify()
 
     def on_strip_changed(self, strip):
-        self.trigger_changed_callback(OscEventType.STRIP_DATA, strip.ssid)
+        self._changed_strips.add(strip.ssid)
+        self._schedule_notify()
+
+    def _schedule_notify(self):
+        if self._notify_handle is not None:
+            return
+        loop = asyncio.get_running_loop()
+        if self.notify_delay:
+            self._notify_handle = loop.call_later(self.notify_delay, self._notify_changes)
+        else:
+            self._notify_handle = loop.call_soon(self._notify_changes)
+
+    def _notify_changes(self):
+        """
+        Deliver the collected changeset, one callback per event type: the strip
+        list changes, GENERAL_DATA with the set of changed keys and STRIP_DATA with the
+        set of changed ssids.
+        """
+        self._notify_handle = None
+
+        strip_list_changes, self._strip_list_changes = self._strip_list_changes, StripListChanges()
+        changed_keys, self._changed_keys = self._changed_keys, set()
+        changed_strips, self._changed_strips = self._changed_strips, set()
+
+        if strip_list_changes:
+            self.trigger_changed_callback(OscEventType.STRIP_LIST, strip_list_changes)
+        if changed_keys:
+            self.trigger_changed_callback(OscEventType.GENERAL_DATA, frozenset(changed_keys))
+        if changed_strips:
+            self.trigger_changed_callback(OscEventType.STRIP_DATA, frozenset(changed_strips))
+
+    # strip values kept in the snapshot, as confirmed by Ardour
+    SNAPSHOT_STRIP_KEYS = ('name', 'strip_type', 'fader', 'gain', 'muted', 'soloed', 'selected')
+    SNAPSHOT_VERSION = 1
+
+    def on_snapshot_changed(self):
+        if self._snapshot_trigger is not None:
+            self._snapshot_trigger.trigger()
+
+    def get_snapshot(self):
+        strips = []
+        for ssid, strip in self.strips.items():
+            values = {}
+            for key in self.SNAPSHOT_STRIP_KEYS:
+                value = strip.get_confirmed(key)
+                # no infinite gain, not valid json
+                if value is None or isinstance(value, float) and math.isinf(value):
+                    continue
+                values[key] = value
+            strips.append([ssid, values])
+        return {
+                'version': self.SNAPSHOT_VERSION,
+                'session_name': self.state.get('session_name'),
+                'strips': strips,
+            }
+
+    def save_snapshot(self):
+        data = json.dumps(self.get_snapshot(), separators=(',', ':'))
+        if data == self._snapshot_saved:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            logging.warning(f'could not save state snapshot: {e}')
+            return
+        self._snapshot_saved = data
+
+    def load_snapshot(self):
+        """
+        Restore the strips and session name of the last run, so the ui has
+        something to show before Ardour answers. The handshake's strip list
+        refresh then reconciles it with the live state.
+        """
+        if not self.snapshot_path or self.strips:
+            return False
+        try:
+            with open(self.snapshot_path) as f:
+                data = f.read()
+            snapshot = json.loads(data)
+            if snapshot.get('version') != self.SNAPSHOT_VERSION:
+                return False
+            strips = snapshot['strips']
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f'ignoring state snapshot: {e!r}')
+            return False
+
+        changes = StripListChanges()
+        for ssid, values in strips:
+            if ssid in self.strips or not (isinstance(ssid, int) or ssid == 'master'):
+                continue
+            strip = self.strips[ssid] = StripState(self, ssid)
+            for key in self.SNAPSHOT_STRIP_KEYS:
+                if key in values:
+                    strip.set(key, values[key])
+            if isinstance(ssid, int):
+                changes.added.add(ssid)
+
+        session_name = snapshot.get('session_name')
+        if session_name is not None:
+            self.state['session_name'] = session_name
+            self._snapshot_session = session_name
+            self.on_general_changed('session_name')
+        self._snapshot_saved = data
+        logging.info(f'restored {len(self.strips)} strips of {session_name!r} from the snapshot')
+        if changes:
+            self.on_strip_list_changed(changes)
+        return True
+
+    def _check_snapshot_session(self, session_name):
+        'The live session name arrived, drop the snapshot strips if it belongs to another session'
+        if self._snapshot_session is None:
+            return
+        if session_name != self._snapshot_session:
+            logging.info(f'snapshot was of session {self._snapshot_session!r}, discarding it')
+            changes = StripListChanges()
+            for ssid in list(self.strips):
+                self._remove_strip(ssid)
+                if isinstance(ssid, int):
+                    changes.removed.add(ssid)
+            if changes:
+                self.on_strip_list_changed(changes)
+        self._snapshot_session = None
 
     def trigger_changed_callback(self, event_type, *args):
         for cb in self.changed_callbacks:
@@ -308,51 +1095,328 @@ class OscRemoteState():
         return self.state.get(key, default)
 
 
+class StripStore():
+    """
+    Columnar storage of all strips' values, one row per ssid. Float values
+    and flags live in compact arrays (NaN / a cleared 'set' bit meaning no
+    value received yet), so a whole bank can be read column-wise. Strings
+    and rarely used values are kept in a small dict per row.
+    """
+
+    FLOAT_COLUMNS = ('fader', 'gain', 'meter', 'meter_level', 'meter_peak', 'pan_position')
+    FLAG_COLUMNS = ('muted', 'soloed', 'recenabled', 'selected', 'expanded')
+
+    # float changes up to this are not reported as changes (meter in dB)
+    DEFAULT_EPSILON = {
+            'meter': .1,
+            'meter_level': .1,
+            'meter_peak': .1,
+            'fader': 1e-5,
+        }
+
+    def __init__(self, epsilon=None):
+        self.epsilon = dict(self.DEFAULT_EPSILON if epsilon is None else epsilon)
+        self.rows = {} # ssid -> row index
+        self.free_rows = []
+        self.floats = { name: array.array('d') for name in self.FLOAT_COLUMNS }
+        self.flag_bits = { name: 1 << i for i, name in enumerate(self.FLAG_COLUMNS) }
+        self.flags = array.array('H')
+        self.flags_set = array.array('H')
+        self.other = []
+        # optimistic values shown until Ardour confirms them, row -> {key: [value, time, rollback handle]}
+        self.predictions = {}
+
+    def row_for(self, ssid):
+        row = self.rows.get(ssid)
+        if row is not None:
+            return row
+
+        if self.free_rows:
+            row = self.free_rows.pop()
+            for column in self.floats.values():
+                column[row] = math.nan
+            self.flags[row] = 0
+            self.flags_set[row] = 0
+            self.other[row] = {}
+        else:
+            row = len(self.other)
+            for column in self.floats.values():
+                column.append(math.nan)
+            self.flags.append(0)
+            self.flags_set.append(0)
+            self.other.append({})
+
+        self.rows[ssid] = row
+        return row
+
+    def remove(self, ssid):
+        row = self.rows.pop(ssid, None)
+        if row is not None:
+            for entry in self.predictions.pop(row, {}).values():
+                entry[2].cancel()
+            self.free_rows.append(row)
+
+    def get(self, row, key, default=None, predicted=True):
+        if predicted and self.predictions:
+            predictions = self.predictions.get(row)
+            if predictions is not None and key in predictions:
+                return predictions[key][0]
+
+        column = self.floats.get(key)
+        if column is not None:
+            value = column[row]
+            return default if value != value else value
+
+        bit = self.flag_bits.get(key)
+        if bit is not None:
+            if self.flags_set[row] & bit:
+                return bool(self.flags[row] & bit)
+            return default
+
+        return self.other[row].get(key, default)
+
+    def set(self, row, key, value):
+        """
+        Store a value, returns whether it actually changed.
+        """
+        column = self.floats.get(key)
+        if column is not None:
+            old = column[row]
+            if old == value or (old != old and value != value):
+                # also unset (NaN) staying unset
+                return False
+            eps = self.epsilon.get(key)
+            if eps is not None and abs(old - value) <= eps:
+                # also false for NaN (unset) and infinite values
+                return False
+            column[row] = value
+            return True
+
+        bit = self.flag_bits.get(key)
+        if bit is not None:
+            if self.flags_set[row] & bit and bool(self.flags[row] & bit) == bool(value):
+                return False
+            self.flags_set[row] |= bit
+            if value:
+                self.flags[row] |= bit
+            else:
+                self.flags[row] &= ~bit
+            return True
+
+        other = self.other[row]
+        if key in other and other[key] == value:
+            return False
+        other[key] = value
+        return True
+
+    def snapshot(self, row):
+        res = dict(self.other[row])
+        for key in self.FLOAT_COLUMNS + self.FLAG_COLUMNS:
+            value = self.get(row, key)
+            if value is not None:
+                res[key] = value
+        for key, entry in self.predictions.get(row, {}).items():
+            res[key] = entry[0]
+        return res
+
+    def clear(self, row, keep=()):
+        'Unset all values of a row but the given keys, dropping its predictions'
+        for key, column in self.floats.items():
+            if key not in keep:
+                column[row] = math.nan
+        for key, bit in self.flag_bits.items():
+            if key not in keep:
+                self.flags_set[row] &= ~bit
+        other = self.other[row]
+        for key in [ key for key in other if key not in keep ]:
+            del other[key]
+        for entry in self.predictions.pop(row, {}).values():
+            entry[2].cancel()
+
+    def read_rows(self, rows):
+        """
+        snapshot() of several rows at once, eg. a whole bank, reading the
+        store column-wise. None rows (removed strips) give empty dicts.
+        """
+        res = [ {} if row is None else dict(self.other[row]) for row in rows ]
+        valid = [ (values, row) for values, row in zip(res, rows) if row is not None ]
+        for key, column in self.floats.items():
+            for values, row in valid:
+                value = column[row]
+                if value == value:
+                    values[key] = value
+        flags, flags_set = self.flags, self.flags_set
+        for key, bit in self.flag_bits.items():
+            for values, row in valid:
+                if flags_set[row] & bit:
+                    values[key] = bool(flags[row] & bit)
+        if self.predictions:
+            for values, row in valid:
+                for key, entry in self.predictions.get(row, {}).items():
+                    values[key] = entry[0]
+        return res
+
+    def get_prediction(self, row, key):
+        return self.predictions.get(row, {}).get(key)
+
+    def set_prediction(self, row, key, entry):
+        self.predictions.setdefault(row, {})[key] = entry
+
+    def pop_prediction(self, row, key):
+        predictions = self.predictions.get(row)
+        if predictions is None:
+            return None
+        entry = predictions.pop(key, None)
+        if not predictions:
+            del self.predictions[row]
+        return entry
+
+
 class StripState():
+    """
+    Handle for one strip's values in the OscRemoteState's StripStore.
+    """
+
+    __slots__ = ('ors', 'ssid', 'row')
+
+    # predicted values are rolled back if Ardour doesn't confirm them in time
+    PREDICTION_TIMEOUT = .5
+    # feedback arriving this soon after a prediction may be the echo of an earlier command
+    PREDICTION_GRACE = .05
+
+    # routing table for plain state messages, sub address -> (state key, type converter)
+    # these are looked up directly, without going through a Dispatcher
+    STATE_ROUTES = {
+            '/expand': ('expanded', bool),
+            '/select': ('selected', bool),
+            '/name': ('name', str),
+            '/group': ('group_name', str),
+            '/mute': ('muted', bool),
+            '/solo': ('soloed', bool),
+            '/recenable': ('recenabled', bool),
+            '/gain': ('gain', float),
+            '/fader': ('fader', float),
+            '/pan_stereo_position': ('pan_position', float),
+        }
     def __init__(self, ors, ssid):
+        # no per strip routing setup, STATE_ROUTES and the dispatch table are shared
         self.ors = ors
         self.ssid = ssid
-        self.state = {}
-        self.dispatcher = self._get_dispatcher()
+        # None once the strip was removed, reads give defaults then
+        self.row = ors.strip_store.row_for(ssid)
 
-    def _get_dispatcher(self):
-        state_dict = {
-                '/expand': ('expanded', bool),
-                '/select': ('selected', bool),
-                '/name': ('name', str),
-                '/meter': ('meter', float),
-                '/group': ('group_name', str),
-                '/mute': ('muted', bool),
-                '/solo': ('soloed', bool),
-                '/recenable': ('recenabled', bool),
-                '/gain': ('gain', float),
-                '/fader': ('fader', float),
-                '/pan_stereo_position': ('pan_position', float),
-            }
-        dispatcher = Dispatcher()
-        for member_name in dir(self.__class__):
-            member = getattr(self.__class__, member_name)
-            if hasattr(member, '_dispatch_to'):
-                for address in member._dispatch_to:
-                    dispatcher.map(address, getattr(self, member_name))
-        for address, (target_name, target_type) in state_dict.items():
-            dispatcher.map(address, self.on_state, target_name, target_type)
-        if LOG_UNKNOWN_MESSAGES:
-            dispatcher.set_default_handler(log_osc_message)
-        return dispatcher
+    def is_valid(self):
+        return self.row is not None
+
+    def clear(self, keep=()):
+        if self.row is not None:
+            self.ors.strip_store.clear(self.row, keep)
+
+    def on_message(self, sub_address, *args):
+        """
+        Handle a strip message with the '/strip' prefix and ssid argument
+        already removed.
+        """
+        route = self.STATE_ROUTES.get(sub_address)
+        if route is not None:
+            self.on_state(sub_address, route, *args)
+            return
+
+        # @dispatch decorated members, exact address match only
+        member_name = get_dispatch_table(self.__class__).get(sub_address)
+        if member_name is not None:
+            getattr(self, member_name)(sub_address, *args)
+        elif LOG_UNKNOWN_MESSAGES:
+            log_osc_message(f'{sub_address} ({self.ssid})', *args)
 
     def on_state(self, address, fixed_args, value=None):
         if value is None:
             logging.warn(f'{address} ({self.ssid}): NONE value')
         target_name, target_type = fixed_args
-        self.state[target_name] = target_type(value)
-        # setattr(self, target_name, target_type(value))
+        value = target_type(value)
+        changed = self.ors.strip_store.set(self.row, target_name, value)
+        if self.ors.strip_store.predictions and self._check_prediction(target_name, value):
+            changed = True
+        if not changed:
+            # repeated value (heartbeat feedback, meters at -inf, echoes), don't wake up the ui
+            return
         self.ors.on_strip_changed(self)
+        if target_name in self.ors.SNAPSHOT_STRIP_KEYS:
+            self.ors.on_snapshot_changed()
         if LOG_STATE_CHANGES:
-            logging.debug(f'{self.ssid}: {target_name} = {target_type(value)!r}')
+            logging.debug(f'{self.ssid}: {target_name} = {value!r}')
+
+    @dispatch('/meter')
+    def on_meter(self, address, value):
+        if self.ors.meters is None:
+            self.on_state(address, ('meter', float), value)
+            return
+        # raw value only, the MeterProcessor publishes the display values
+        value = float(value)
+        self.ors.strip_store.set(self.row, 'meter', value)
+        self.ors.meters.push(self.ssid, value)
+
+    def predict(self, key, value, timeout=None):
+        """
+        Show value for key right away, until Ardour's feedback confirms or
+        overrides it, or the timeout rolls it back.
+        """
+        if self.row is None:
+            return
+        store = self.ors.strip_store
+        loop = asyncio.get_running_loop()
+        old = store.pop_prediction(self.row, key)
+        if old is not None:
+            old[2].cancel()
+        handle = loop.call_later(self.PREDICTION_TIMEOUT if timeout is None else timeout, self._rollback_prediction, key)
+        store.set_prediction(self.row, key, [value, loop.time(), handle])
+        self.ors.on_strip_changed(self)
+
+    def _rollback_prediction(self, key):
+        if self.ors.strip_store.pop_prediction(self.row, key) is not None:
+            logging.debug(f'{self.ssid}: prediction for {key} not confirmed, rolled back')
+            self.ors.on_strip_changed(self)
+
+    def _check_prediction(self, key, value):
+        'Returns whether a prediction was removed'
+        store = self.ors.strip_store
+        entry = store.get_prediction(self.row, key)
+        if entry is None:
+            return False
+
+        predicted, predicted_time, handle = entry
+        if isinstance(value, float):
+            confirmed = abs(value - predicted) < 1e-4
+        else:
+            confirmed = value == predicted
+        if not confirmed and asyncio.get_running_loop().time() - predicted_time < self.PREDICTION_GRACE:
+            return False
+
+        store.pop_prediction(self.row, key)
+        handle.cancel()
+        return True
 
     def get(self, key, default=None):
-        return self.state.get(key, default)
+        if self.row is None:
+            return default
+        return self.ors.strip_store.get(self.row, key, default)
+
+    def get_confirmed(self, key, default=None):
+        'Value as last reported by Ardour, ignoring predictions'
+        if self.row is None:
+            return default
+        return self.ors.strip_store.get(self.row, key, default, predicted=False)
+
+    def set(self, key, value):
+        if self.row is None:
+            return False
+        return self.ors.strip_store.set(self.row, key, value)
+
+    def snapshot(self):
+        'Plain dict copy of the state, eg. to send to the render process'
+        if self.row is None:
+            return {}
+        return self.ors.strip_store.snapshot(self.row)
 
 
 def main_osc():
@@ -0,0 +1,118 @@
+import collections
+import importlib
+import logging
+import sys
+import time
+
+class StartupProfiler():
+    """
+    Collects import times of lazily loaded subsystems and timestamps of
+    startup milestones (relative to the given start time), and logs a summary
+    once the first frame reached the device.
+    """
+
+    def __init__(self, start_time=None, enabled=True):
+        self.start_time = time.perf_counter() if start_time is None else start_time
+        self.enabled = enabled
+        self.marks = []
+        self.import_times = {}
+        self.reported = not enabled
+
+    def mark(self, name):
+        if self.enabled:
+            self.marks.append((name, time.perf_counter() - self.start_time))
+
+    def import_module(self, name):
+        # already imported modules are free, don't record them
+        if not self.enabled or name in sys.modules:
+            return importlib.import_module(name)
+
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        self.import_times[name] = time.perf_counter() - start
+        return module
+
+    def report(self):
+        if not self.enabled:
+            return
+        self.reported = True
+
+        logging.info('startup profile:')
+        for name, t in self.marks:
+            logging.info(f'  {t*1000:8.1f} ms  {name}')
+        for name, t in self.import_times.items():
+            logging.info(f'  import {name}: {t*1000:.1f} ms')
+
+
+class OscTrafficProfiler():
+    """
+    Message counts, bytes and handling time of received OSC traffic per
+    address, totals and rates over a sliding window. Install into an
+    OscRemoteState with set_traffic_profiler(), without one installed the
+    datagram path is unchanged.
+    """
+
+    def __init__(self, window=10):
+        self.window = window
+        self.stats = {} # address -> [count, bytes, seconds]
+        # per second buckets for the window, (second, {address: [count, bytes, seconds]})
+        self.buckets = collections.deque()
+        self.start_time = time.monotonic()
+
+    def record(self, address, size, elapsed):
+        entry = self.stats.get(address)
+        if entry is None:
+            entry = self.stats[address] = [0, 0, 0.]
+        entry[0] += 1
+        entry[1] += size
+        entry[2] += elapsed
+
+        second = int(time.monotonic())
+        if not self.buckets or self.buckets[-1][0] != second:
+            self.buckets.append((second, {}))
+            while self.buckets[0][0] <= second - self.window:
+                self.buckets.popleft()
+        bucket = self.buckets[-1][1]
+        entry = bucket.get(address)
+        if entry is None:
+            entry = bucket[address] = [0, 0, 0.]
+        entry[0] += 1
+        entry[1] += size
+        entry[2] += elapsed
+
+    def snapshot(self):
+        'Address -> stats dict, most expensive first'
+        now = time.monotonic()
+        # the current second is partial
+        span = min(self.window, now - self.start_time) or 1.
+        oldest = int(now) - self.window
+        windowed = {}
+        for second, bucket in self.buckets:
+            if second <= oldest:
+                continue
+            for address, (count, size, elapsed) in bucket.items():
+                entry = windowed.setdefault(address, [0, 0, 0.])
+                entry[0] += count
+                entry[1] += size
+                entry[2] += elapsed
+
+        res = {}
+        for address, (count, size, elapsed) in sorted(self.stats.items(), key=lambda item: -item[1][2]):
+            w_count, w_size, w_elapsed = windowed.get(address, (0, 0, 0.))
+            res[address.decode(errors='replace') if isinstance(address, bytes) else address] = {
+                    'count': count,
+                    'bytes': size,
+                    'time': elapsed,
+                    'us_per_msg': elapsed * 1e6 / count,
+                    'rate': w_count / span,
+                    'byte_rate': w_size / span,
+                    'load': w_elapsed / span, # fraction of wall time spent handling
+                }
+        return res
+
+    def report(self):
+        snapshot = self.snapshot()
+        logging.info(f'osc traffic profile ({len(snapshot)} addresses, rates over {self.window}s):')
+        for address, s in snapshot.items():
+            logging.info(f'  {address:<32} {s["count"]:>9} msgs {s["bytes"]:>11} B {s["time"]*1000:>9.1f} ms {s["us_per_msg"]:>7.1f} us/msg'
+                    f' | {s["rate"]:>8.1f} msgs/s {s["byte_rate"]:>10.0f} B/s {s["load"]*100:>5.1f}% load')
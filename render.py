@@ -0,0 +1,52 @@
+import asyncio
+import concurrent.futures
+import logging
+import time
+
+class RenderExecutor():
+    """
+    Draws screen drawers concurrently in a thread pool, cairo releases the GIL
+    while rasterising. Dirty strip tiles are drawn first (in parallel), then
+    the screens compositing them.
+
+    With max_workers=0 everything is drawn inline on the event loop.
+    """
+
+    def __init__(self, max_workers=2, frame_budget=.03):
+        self.frame_budget = frame_budget
+        if max_workers:
+            self._pool = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix='render')
+        else:
+            self._pool = None
+
+        self.frame_count = 0
+        self.overrun_count = 0
+        self.last_frame_time = None
+
+    async def _run_jobs(self, jobs):
+        if self._pool is None or len(jobs) <= 1:
+            for job in jobs:
+                job()
+        else:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(self._pool, job) for job in jobs))
+
+    async def render(self, drawers):
+        # the same drawer may be shown on both screens, never draw it twice at once
+        drawers = list(dict.fromkeys(drawers))
+
+        start = time.perf_counter()
+        # get_tile_jobs takes the frame's values, still on the event loop
+        await self._run_jobs([job for drawer in drawers for job in getattr(drawer, 'get_tile_jobs', list)()])
+        await self._run_jobs([drawer.draw for drawer in drawers])
+        elapsed = time.perf_counter() - start
+
+        self.frame_count += 1
+        self.last_frame_time = elapsed
+        if elapsed > self.frame_budget:
+            self.overrun_count += 1
+            logging.debug(f'frame took {elapsed*1000:.1f} ms, budget {self.frame_budget*1000:.1f} ms ({self.overrun_count}/{self.frame_count} over budget)')
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
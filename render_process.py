@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import multiprocessing
+
+import frame_shm
+import gui
+
+# Optional renderer process for the strip view. The main process keeps HID
+# input and the OSC state and only sends compact snapshots of the visible
+# strips, the renderer draws them and writes finished RGB565 frames into
+# shared memory. That way drawing never competes with input handling for
+# the GIL.
+
+RENDER_SHM_NAME = 'nikontrol_render'
+
+def _renderer_main(conn, shm_name):
+    frame_buffer = frame_shm.SharedFrameBuffer(shm_name, create=True)
+    banks = [gui.StripBankDrawer({}), gui.StripBankDrawer({})]
+    strip_drawers = [[], []]
+
+    conn.send(('ready', shm_name))
+
+    try:
+        while True:
+            try:
+                snapshot = conn.recv()
+                # only the latest snapshot is of interest
+                while conn.poll():
+                    snapshot = conn.recv()
+            except EOFError:
+                return
+
+            for screen, (bank, drawers, strips) in enumerate(zip(banks, strip_drawers, snapshot['screens'])):
+                bank.osc_state = snapshot['globals']
+                while len(drawers) < len(strips):
+                    drawers.append(gui.StripDrawer({}))
+                for drawer, (state, highlight) in zip(drawers, strips):
+                    if drawer.strip_state != state or drawer.highlight != highlight:
+                        drawer.strip_state = state
+                        drawer.highlight = highlight
+                        drawer.dirty = True
+                bank.set_strip_list(drawers[:len(strips)])
+                bank.draw()
+                frame_buffer.write(screen, bank.ims.get_data())
+
+            conn.send(('frame', [frame_buffer.get_frame_number(screen) for screen in range(frame_shm.SCREENS)]))
+
+    finally:
+        frame_buffer.close()
+
+class RenderProcess():
+
+    def __init__(self, logic):
+        self.logic = logic
+        self.frame_buffer = None
+        self._busy = True # until the renderer reported to be ready
+        self._pending = None
+        self._view = None
+        self.process = None
+
+    def start(self):
+        # spawn, the renderer doesn't need (and shouldn't inherit) GTK/USB state
+        ctx = multiprocessing.get_context('spawn')
+        self._conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_renderer_main, args=(child_conn, RENDER_SHM_NAME), daemon=True, name='nikontrol-render')
+        self.process.start()
+        child_conn.close()
+        asyncio.get_running_loop().add_reader(self._conn.fileno(), self._on_readable)
+
+    def stop(self):
+        if self.process is None:
+            return
+        asyncio.get_event_loop().remove_reader(self._conn.fileno())
+        self._conn.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+        if self.frame_buffer is not None:
+            self.frame_buffer.close()
+        self.process = None
+
+    @staticmethod
+    def build_strip_snapshot(strip_view):
+        ors = strip_view.ardour_logic.ors
+        return {
+                'globals': { 'session_name': ors.get('session_name', '-') },
+                'screens': [
+                    [ (strip.strip_state.snapshot(), strip.highlight) for strip in bank.strips ]
+                    for bank in (strip_view.ui_left, strip_view.ui_right)
+                ],
+            }
+
+    def submit(self, strip_view):
+        self._view = strip_view
+        self._send(self.build_strip_snapshot(strip_view))
+
+    def _send(self, snapshot):
+        if self._busy:
+            # renderer still working, only keep the newest snapshot
+            self._pending = snapshot
+            return
+        self._busy = True
+        self._conn.send(snapshot)
+
+    def _on_readable(self):
+        try:
+            msg, data = self._conn.recv()
+        except EOFError:
+            process = self.process
+            self.stop()
+            logging.error(f'render process exited (exit code {process.exitcode}), drawing in process from now on')
+            # StripView.draw falls back to logic.render_screens
+            if self.logic.render_process is self:
+                self.logic.render_process = None
+            self.logic.redraw_trigger.trigger()
+            return
+
+        if msg == 'ready':
+            self.frame_buffer = frame_shm.SharedFrameBuffer(data)
+            logging.info('render process ready')
+
+        elif msg == 'frame' and self.logic.view_list[-1] is self._view:
+            # (frames finished after leaving the strip view are dropped)
+            for screen in range(frame_shm.SCREENS):
+                try:
+                    _, frame = self.frame_buffer.read(screen)
+                except BlockingIOError:
+                    continue
+                self.logic.upload_image(screen, 0, 0, gui.surface_from_rgb565(frame))
+
+        self._busy = False
+        if self._pending is not None:
+            snapshot, self._pending = self._pending, None
+            self._send(snapshot)
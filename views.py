@@ -8,8 +8,6 @@ if TYPE_CHECKING:
     import main
 
 import gui
-import gui_hw
-import osc_state
 import util
 
 
@@ -48,13 +46,7 @@ class GlobalView(View):
         self.cross_drawer = gui.CrossDrawer()
 
     def draw(self, logic):
-
-        self.cross_drawer.draw()
-
-        logic.upload_image(0, 0, 0, self.cross_drawer.ims)
-        logic.upload_image(1, 0, 0, self.cross_drawer.ims)
-
-        return True
+        return logic.render_screens(self.cross_drawer, self.cross_drawer)
 
     def button_pressed(self, logic: main.Logic, button: util.Buttons) -> None:
 
@@ -81,11 +73,16 @@ class GlobalView(View):
         return res
 
     def get_general_config(self) -> Mapping[util.GeneralOptions, bool]:
+        import gui_hw
         return gui_hw.GeneralOptionsManager.get_default_config()
 
 
 class StripView(View):
     def __init__(self, ardour_logic):
+        import osc_state
+        # for the event types, imported once and not per notification
+        self._osc_state = osc_state
+
         self.ardour_logic = ardour_logic
         self.logic = ardour_logic.logic
 
@@ -94,47 +91,42 @@ class StripView(View):
 
         self.strips = []
         self.highlight_index = None
+        self.highlight_name = None
         self.page_index = 0
 
     def draw(self, logic):
-        self.ui_left.draw()
-        self.ui_right.draw()
-        logic.upload_image(0, 0, 0, self.ui_left.ims)
-        logic.upload_image(1, 0, 0, self.ui_right.ims)
-        return True
+        if logic.render_process is not None:
+            logic.render_process.submit(self)
+            return True
+        return logic.render_screens(self.ui_left, self.ui_right)
 
     def _update_highlight_for_new_list(self, new_list):
+        # strip states are updated in place, so follow the highlight by the name it had when set
+        if self.highlight_index is not None and self.highlight_index < len(self.strips):
+            self.strips[self.highlight_index].set_highlight(False)
 
-        if len(new_list) > 0:
-            if self.highlight_index is not None:
-                name = self.strips[self.highlight_index].strip_state.get('name', None)
-
-                if self.highlight_index in new_list and new_list[self.highlight_index].get('name', None) == name:
-                    pass
-
-                else:
-                    for i, strip in enumerate(new_list):
-                        print(f'trying name {strip.strip_state.get("name", None)!r}')
-                        if strip.strip_state.get('name', None) == name:
-                            self.highlight_index = i
-                            break
-                    else:
-                        print(f'name not found {name!r}')
-                        self.highlight_index = None
-
-            if self.highlight_index is None:
-                for i, strip in enumerate(new_list):
-                    if strip.strip_state.get('selected', False):
-                        self.highlight_index = i
-                        print('fallback selected')
-                else:
-                    self.highlight_index = 0
-
-        else:
-            self.highlight_index = None
-
+        new_index = None
         if self.highlight_index is not None:
-            new_list[self.highlight_index].set_highlight(True)
+            for i, strip in enumerate(new_list):
+                if strip.strip_state.get('name', None) == self.highlight_name:
+                    new_index = i
+                    break
+            else:
+                print(f'name not found {self.highlight_name!r}')
+
+        if new_index is None:
+            for i, strip in enumerate(new_list):
+                if strip.strip_state.get('selected', False):
+                    new_index = i
+                    print('fallback selected')
+                    break
+            else:
+                new_index = 0 if new_list else None
+
+        self.highlight_index = new_index
+        if new_index is not None:
+            new_list[new_index].set_highlight(True)
+            self.highlight_name = new_list[new_index].strip_state.get('name', None)
 
     def _set_highlight_relative(self, v):
         if self.highlight_index is None:
@@ -151,37 +143,63 @@ class StripView(View):
             self.strips[self.highlight_index].set_highlight(False)
         self.strips[new_index].set_highlight(True)
         self.highlight_index = new_index
+        self.highlight_name = self.strips[new_index].strip_state.get('name', None)
         new_page_index = new_index // 8
         if new_page_index != self.page_index:
-            self.page_index = new_page_index
-            self.ui_left.set_strip_list(self.strips[new_page_index*8:new_page_index*8+4])
-            self.ui_right.set_strip_list(self.strips[new_page_index*8+4:new_page_index*8+8])
+            self._show_page(new_page_index)
         return True
 
+    def _show_page(self, page_index):
+        self.page_index = page_index
+        self.ui_left.set_strip_list(self.strips[page_index*8:page_index*8+4])
+        self.ui_right.set_strip_list(self.strips[page_index*8+4:page_index*8+8])
+        self.ardour_logic.set_page(page_index)
+
     def on_osc_event(self, ardour_logic, event_type, *args):
+        osc_state = self._osc_state
 
         if event_type == osc_state.OscEventType.GENERAL_DATA:
-            pass
+            changed_keys, = args
+            if 'session_name' not in changed_keys:
+                # nothing else of the global state is displayed
+                return
 
         elif event_type == osc_state.OscEventType.STRIP_LIST:
-            new_list = [gui.StripDrawer(strip) for strip in ardour_logic.ors.get_drawable_strips()]
-            self._update_highlight_for_new_list(new_list)
-            self.strips = new_list
-            logging.debug(f'new strips {self.strips}')
-            self.page_index = self.highlight_index // 8 if self.highlight_index is not None else 0
-            self.ui_left.set_strip_list(self.strips[self.page_index*8:self.page_index*8+4])
-            self.ui_right.set_strip_list(self.strips[self.page_index*8+4:self.page_index*8+8])
-            for strip in self.strips:
-                strip.update()
+            changes, = args
+
+            if changes.added or changes.removed:
+                # keep the drawers of strips that are still there, a removed
+                # and re-added ssid is a new StripState
+                drawers = { strip.strip_state.ssid: strip for strip in self.strips }
+                new_list = []
+                for strip in ardour_logic.ors.get_drawable_strips():
+                    drawer = drawers.get(strip.ssid)
+                    if drawer is None or drawer.strip_state is not strip:
+                        drawer = gui.StripDrawer(strip)
+                    new_list.append(drawer)
+            else:
+                new_list = self.strips
+
+            for strip in new_list:
+                if strip.strip_state.ssid in changes.renamed or strip.strip_state.ssid in changes.reordered:
+                    strip.update()
+
+            if new_list is not self.strips or changes.reordered or changes.renamed:
+                self._update_highlight_for_new_list(new_list)
+                self.strips = new_list
+                logging.debug(f'new strips {self.strips}')
+                self._show_page(self.highlight_index // 8 if self.highlight_index is not None else 0)
 
         elif event_type == osc_state.OscEventType.STRIP_DATA:
-            ssid, = args
+            changed_ssids, = args
+            ardour_logic.fader_targets.reconcile(changed_ssids)
             for strip in self.strips:
-                if strip.strip_state.ssid == ssid:
+                if strip.strip_state.ssid in changed_ssids:
                     strip.update()
 
-        self.logic.redraw_trigger.trigger() # XXX
-        self.logic.config_trigger.trigger()
+        if self in self.logic.view_list:
+            self.logic.redraw_trigger.trigger()
+            self.logic.config_trigger.trigger()
 
     def button_pressed(self, logic, button):
         if button == util.Buttons.Mute:
@@ -192,7 +210,9 @@ class StripView(View):
                 slist = [self.strips[self.page_index*8 + i] for i in tlist if self.page_index*8 + i <= len(self.strips)]
 
             for s in slist:
-                logic.send_strip_command(s.strip_state, '/mute', 0 if s.strip_state.get('muted', False) else 1)
+                muted = not s.strip_state.get('muted', False)
+                self.ardour_logic.send_strip_command(s.strip_state, '/mute', 1 if muted else 0)
+                s.strip_state.predict('muted', muted)
 
         if button == util.Buttons.Solo:
             tlist = logic.get_touched_knobs()
@@ -202,7 +222,12 @@ class StripView(View):
                 slist = [self.strips[self.page_index*8 + i] for i in tlist if self.page_index*8 + i <= len(self.strips)]
 
             for s in slist:
-                logic.send_strip_command(s.strip_state, '/solo', 0 if s.strip_state.get('soloed', False) else 1)
+                soloed = not s.strip_state.get('soloed', False)
+                self.ardour_logic.send_strip_command(s.strip_state, '/solo', 1 if soloed else 0)
+                s.strip_state.predict('soloed', soloed)
+
+        if button == util.Buttons.Clear and logic.get_current_button_state(util.Buttons.Shift):
+            logic.report_osc_traffic()
 
         if button == util.Buttons.Bigknob_Left:
             self._set_highlight_relative(-1)
@@ -217,7 +242,7 @@ class StripView(View):
         if button == util.Buttons.Bigknob_Push:
             if self.highlight_index is not None:
                 strip = self.strips[self.highlight_index]
-                logic.send_strip_command(strip.strip_state, '/selected', 1)
+                self.ardour_logic.send_strip_command(strip.strip_state, '/selected', 1)
 
         if (index := button.get_button_index()) is not None:
             new_highlight = self.page_index * 8 + index
@@ -264,13 +289,13 @@ class StripView(View):
             return
 
         strip = self.strips[index]
-        fader_value = strip.strip_state.get('fader', 0)
         if logic.get_current_button_state(util.Buttons.Shift):
-            new_value = fader_value + delta * .0002
+            step = .0002
         else:
-            new_value = fader_value + delta * .002
+            step = .002
 
-        self.ardour_logic.send_strip_command(strip.strip_state, '/fader', new_value)
+        # accumulated and rate limited, see main.FaderTargets
+        self.ardour_logic.fader_targets.add_delta(strip.strip_state, delta * step)
 
         self.logic.redraw_trigger.trigger() # XXX
         self.logic.config_trigger.trigger()
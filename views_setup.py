@@ -23,14 +23,7 @@ class SetupView(views.View):
         self.ui_right = gui.CrossDrawer()
 
     def draw(self, logic):
-
-        self.ui_left.draw()
-        self.ui_right.draw()
-
-        logic.upload_image(0, 0, 0, self.ui_left.ims)
-        logic.upload_image(1, 0, 0, self.ui_right.ims)
-
-        return True
+        return logic.render_screens(self.ui_left, self.ui_right)
 
     def set_highlight_relative(self, value):
         self.highlight_index = (self.highlight_index + value) % len(self.options)
@@ -99,13 +92,7 @@ class TabledSetupView(views.View):
                 (self.highlight_index[0]-4, self.highlight_index[1])
             )
 
-        self.ui_left.draw()
-        self.ui_right.draw()
-
-        logic.upload_image(0, 0, 0, self.ui_left.ims)
-        logic.upload_image(1, 0, 0, self.ui_right.ims)
-
-        return True
+        return logic.render_screens(self.ui_left, self.ui_right)
 
     def button_pressed(self, logic: main.Logic, button: util.Buttons) -> None:
 